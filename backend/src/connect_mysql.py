@@ -1,6 +1,9 @@
 import datetime
+import threading
+import time
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
 
 # 创建对象，所有数据库方法从db取
@@ -39,6 +42,46 @@ class DonorInfo(db.Model):
                f'available{self.available})'
 
 
+class SerialCounter(db.Model):
+    # 每日流水号计数器，按(日期, 样品代码)分别计数
+    __tablename__ = 'SerialCounter'
+    day = db.Column(db.String(8), primary_key=True)
+    sample_code = db.Column(db.String(8), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
+
+def max_serial_num(day: str, sample_code: str):
+    """
+    已存在的该日期、样品代码的流水号(日期_样品代码_序号)中最大的序号，没有时为0
+    """
+    prefix = f'{day}_{sample_code}_'
+    serials = db.session.execute(db.select(DonorInfo.serial)
+                                 .filter(DonorInfo.serial.startswith(prefix, autoescape=True))).scalars()
+    nums = [int(num) for num in (serial[len(prefix):].split('_')[0] for serial in serials) if num.isdigit()]
+    return max(nums, default=0)
+
+
+def allocate_serial(day: str, sample_code: str):
+    """
+    分配流水号中的当日序号，不提交事务，由add与数据一起提交
+    计数行在事务结束前保持写锁，并发请求不会拿到重复号码
+    :param day: 流水号中的日期，如20230901
+    :return: 分配到的序号
+    """
+    key = (SerialCounter.day == day) & (SerialCounter.sample_code == sample_code)
+    res = db.session.execute(db.update(SerialCounter).where(key).values(value=SerialCounter.value + 1))
+    if res.rowcount == 0:
+        # 当天该样品的第一个号码，从已存在的同前缀流水号的最大序号开始，兼容启用计数器之前录入的数据(序号可能不连续)
+        values = {'day': day, 'sample_code': sample_code, 'value': max_serial_num(day, sample_code) + 1}
+        if db.session.get_bind().dialect.name == 'mysql':
+            stmt = mysql.insert(SerialCounter).values(values).on_duplicate_key_update(value=SerialCounter.value + 1)
+        else:
+            stmt = sqlite.insert(SerialCounter).values(values).on_conflict_do_update(
+                index_elements=['day', 'sample_code'], set_={'value': SerialCounter.value + 1})
+        db.session.execute(stmt)
+    return db.session.execute(db.select(SerialCounter.value).where(key)).scalar_one()
+
+
 def add(name, age, gender, id_num, sample_type, sample_quantity, date, place, phone, serial, available):
     """
     给数据库加入数据
@@ -89,21 +132,61 @@ def query(keyword: str, con: str):
     return res
 
 
-def query_all():
+def query_all(chunk_size=500):
     """
     返回所有对象
-    :return: 一个包含了所有对象的列表
+    :return: 按块从数据库读取的对象迭代器，需在请求上下文中遍历
     """
-    # res = db.session.execute(db.select(DonorInfo).order_by(DonorInfo.serial)).scalars()
-    res = DonorInfo.query.all()
+    res = db.session.execute(db.select(DonorInfo).execution_options(yield_per=chunk_size)).scalars()
     return res
 
 
-def query_paginate(page=1, per_page=10):
-    res = DonorInfo.query.paginate(page=page, per_page=per_page)
+def query_paginate(page=1, per_page=10, count=True):
+    """
+    按页码分页
+    :param count: 是否统计总数(COUNT(*))，为False时由调用方使用approximate_total
+    """
+    res = DonorInfo.query.order_by(DonorInfo.id).paginate(page=page, per_page=per_page, count=count)
     return res
 
 
+def query_keyset(cursor=None, per_page=10):
+    """
+    游标分页，按id升序，cursor为上一页最后一条的id
+    使用主键范围查询，每页耗时与页数无关
+    :return: (本页对象列表, 下一页的cursor，没有下一页时为None)
+    """
+    stmt = db.select(DonorInfo).order_by(DonorInfo.id).limit(per_page + 1)
+    if cursor is not None:
+        stmt = stmt.filter(DonorInfo.id > cursor)
+    items = db.session.execute(stmt).scalars().all()
+    if len(items) > per_page:
+        items = items[:per_page]
+        return items, items[-1].id
+    return items, None
+
+
+_total_lock = threading.Lock()
+_total_cache = {"value": None, "expire_at": 0.0}
+
+
+def approximate_total(ttl=60):
+    """
+    数据总条数的近似值，结果缓存ttl秒
+    由主键的最大值和最小值估算，只读索引两端，不做全表COUNT(*)；录入失败留下的id空缺会使其略偏大
+    """
+    now = time.monotonic()
+    with _total_lock:
+        if _total_cache["value"] is not None and _total_cache["expire_at"] > now:
+            return _total_cache["value"]
+    low, high = db.session.execute(db.select(db.func.min(DonorInfo.id), db.func.max(DonorInfo.id))).one()
+    value = 0 if low is None else high - low + 1
+    with _total_lock:
+        _total_cache["value"] = value
+        _total_cache["expire_at"] = now + ttl
+    return value
+
+
 def choose_attr(attr_name: str):
     """根据传入字符串返回DonorInfo类中的属性"""
     attr_dict = {
@@ -130,14 +213,15 @@ def fuzzy_query(attr_name: str, con: str):
     return res_list
 
 
-def query_date(start: str, end: str):
+def query_date(start: str, end: str, chunk_size=500):
     """
-    根据时间段返回结果
+    根据时间段返回结果，按块读取
     """
     starttime = start + ' ' + '0:0:0'
     endtime = end + ' ' + '23:59:59'
-    record_list = DonorInfo.query.filter(DonorInfo.date >= starttime).filter(DonorInfo.date <= endtime) \
-        .order_by(DonorInfo.date.desc()).all()
+    record_list = db.session.execute(db.select(DonorInfo).filter(DonorInfo.date >= starttime)
+                                     .filter(DonorInfo.date <= endtime).order_by(DonorInfo.date.desc())
+                                     .execution_options(yield_per=chunk_size)).scalars()
     return record_list
 
 
@@ -145,12 +229,9 @@ def query_today_num():
     """
     获取今日的数据条目数量
     """
-    time_now = datetime.datetime.today()
-    # 筛选出当天的录入信息
-    res = db.session.execute(db.select(DonorInfo).filter(db.cast(DonorInfo.create_time, db.DATE) ==
-                                                         db.cast(datetime.datetime.now(), db.DATE))).scalars()
-    # 没有len方法，手动获取录入信息的数量
-    num = 0
-    for i in res:
-        num += 1
-    return num
+    # 用半开区间筛选当天的录入信息，由数据库计数
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    tomorrow = today + datetime.timedelta(days=1)
+    return db.session.execute(db.select(db.func.count(DonorInfo.id))
+                              .filter(DonorInfo.create_time >= today)
+                              .filter(DonorInfo.create_time < tomorrow)).scalar()
@@ -0,0 +1,91 @@
+import json
+from datetime import date, datetime
+
+from loguru import logger
+
+
+class ComlexEncoder(json.JSONEncoder):
+    """
+    重写构造json类，遇到日期时间特殊处理，其余使用内置
+    调用：dumps(data, cls=ComlexEncoder)
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.strftime('%Y-%m-%d %H:%M:%S')
+        elif isinstance(o, date):
+            return o.strftime('%Y-%m-%d')
+        else:
+            return json.JSONEncoder.default(self, o)
+
+
+_encoder = ComlexEncoder(ensure_ascii=False)
+
+
+def to_json(obj):
+    """使用共享的编码器转换为json"""
+    return _encoder.encode(obj)
+
+
+def donor_to_dict(di):
+    """
+    单个信息转换为字典
+    """
+    return {
+        "name": di.name,
+        "age": di.age,
+        "gender": di.gender,
+        "id_num": di.id_num,
+        "sample_type": di.sample_type,
+        "sample_quantity": di.sample_quantity,
+        "date": di.date.strftime("%Y-%m-%d") if di.date else None,
+        "place": di.place,
+        "phone": di.phone,
+        "serial": di.serial,
+        "available": di.available,
+        "create_time": di.create_time,
+        "update_time": di.update_time
+    }
+
+
+def donor_to_json(di):
+    """
+    单个信息转换为json
+    """
+    return to_json(donor_to_dict(di))
+
+
+def donors_to_list(dis):
+    """
+    多个信息转换为字典列表，用于嵌入其他结构后一次性编码
+    """
+    res_list = [donor_to_dict(di) for di in dis]
+    logger.debug(f'转换{len(res_list)}条数据')
+    return res_list
+
+
+def donors_to_json(dis):
+    """
+    多个信息转换为json数组，只编码一次
+    """
+    return to_json(donors_to_list(dis))
+
+
+def iter_donors_json(dis, chunk_size: int = 500):
+    """
+    逐块输出json数组，配合流式响应使用，内存占用与总条数无关
+    """
+    yield '['
+    count = 0
+    chunk = []
+    for di in dis:
+        chunk.append(to_json(donor_to_dict(di)))
+        if len(chunk) >= chunk_size:
+            yield (',' if count else '') + ','.join(chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        yield (',' if count else '') + ','.join(chunk)
+        count += len(chunk)
+    yield ']'
+    logger.debug(f'流式输出{count}条数据')
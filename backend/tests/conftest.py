@@ -0,0 +1,26 @@
+"""
+测试直接使用src.connect_mysql，数据库为SQLite内存数据库，不需要MySQL
+
+    cd backend && python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main在导入时连接数据库，设置后不再提示输入MySQL用户名和密码
+os.environ['DONOR_DATABASE_URL'] = 'sqlite://'
+
+import pytest
+from flask import Flask
+
+from src.connect_mysql import db
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
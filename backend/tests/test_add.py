@@ -0,0 +1,27 @@
+import datetime
+
+import main
+
+
+def donor(**fields):
+    values = dict(name='张三', age=30, gender='男', id_num='110101199001010001', sample_type='骨髓',
+                  sample_quantity='1', date='2023-09-01', place='北京', phone='13800000000')
+    values.update(fields)
+    return values
+
+
+def test_add_accepts_iso_date_on_sqlite():
+    client = main.app.test_client()
+    today = datetime.date.today().strftime('%Y%m%d')
+    first = client.post('/add', json=donor()).get_json()
+    second = client.post('/add', json=donor(date='2023-09-01 08:30:00')).get_json()
+    assert (first['res'], second['res']) == ('写入完成', '写入完成')
+    assert int(second['serial'].rsplit('_', 1)[1]) == int(first['serial'].rsplit('_', 1)[1]) + 1
+    assert first['serial'].startswith(f'{today}_BM_')
+    assert first['date'] == '2023-09-01'
+
+
+def test_parse_datetime():
+    assert main.parse_datetime('2023-09-01') == datetime.datetime(2023, 9, 1)
+    assert main.parse_datetime('2023/9/1') == '2023/9/1'
+    assert main.parse_datetime(None) is None
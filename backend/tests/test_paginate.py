@@ -0,0 +1,42 @@
+import main
+from src.connect_mysql import DonorInfo, db
+
+
+def add_donors(ids):
+    with main.app.app_context():
+        db.session.query(DonorInfo).delete()
+        for donor_id in ids:
+            db.session.add(DonorInfo(id=donor_id, name=f'张三{donor_id}'))
+        db.session.commit()
+
+
+def test_page_total_is_exact_by_default():
+    # id有空缺时，近似值(max-min+1)会多出空页
+    add_donors([1, 2, 3, 50])
+    client = main.app.test_client()
+    exact = client.post('/paginate_query', json={'currentPage': 1, 'perPage': 2}).get_json()
+    assert exact['total'] == 2
+    assert [d['name'] for d in exact['res']] == ['张三1', '张三2']
+    approximate = client.post('/paginate_query',
+                              json={'currentPage': 1, 'perPage': 2, 'approximateTotal': True}).get_json()
+    assert approximate['total'] == 25
+    assert [d['name'] for d in approximate['res']] == ['张三1', '张三2']
+
+
+def test_cursor_pages():
+    add_donors([1, 2, 3, 50])
+    client = main.app.test_client()
+    first = client.post('/paginate_query', json={'cursor': None, 'perPage': 3}).get_json()
+    second = client.post('/paginate_query', json={'cursor': first['nextCursor'], 'perPage': 3}).get_json()
+    assert [d['name'] for d in first['res']] == ['张三1', '张三2', '张三3']
+    assert ([d['name'] for d in second['res']], second['nextCursor']) == (['张三50'], None)
+    assert 'total' not in first
+
+
+def test_engine_options(monkeypatch):
+    monkeypatch.setenv('DONOR_POOL_SIZE', '20')
+    monkeypatch.setenv('DONOR_POOL_PRE_PING', 'true')
+    options = main.engine_options('mysql+pymysql://user:pw@127.0.0.1:3306/test_db')
+    assert options == {'pool_recycle': 3600, 'pool_pre_ping': True, 'pool_size': 20, 'max_overflow': 10}
+    # 内存数据库不接受连接池大小参数
+    assert 'pool_size' not in main.engine_options('sqlite://')
@@ -0,0 +1,16 @@
+from src.connect_mysql import DonorInfo, allocate_serial, db
+
+
+def test_allocate_serial_counts_per_sample_code(app):
+    assert [allocate_serial('20230901', 'BM') for _ in range(3)] == [1, 2, 3]
+    assert allocate_serial('20230901', 'PB') == 1
+
+
+def test_allocate_serial_starts_after_highest_existing_suffix(app):
+    # 旧版本按当天数量生成的流水号可能不连续，以数量为起点会写入重复的流水号
+    for serial in ('20230901_BM_003', '20230901_BM_001', '20230901_PB_009'):
+        db.session.add(DonorInfo(serial=serial))
+    db.session.commit()
+    assert allocate_serial('20230901', 'BM') == 4
+    assert allocate_serial('20230901', 'BM') == 5
+    assert allocate_serial('20230901', 'CB') == 1
@@ -0,0 +1,37 @@
+import datetime
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from src.serializer import donor_to_json, donors_to_json, iter_donors_json
+
+
+def make_donor(i):
+    return SimpleNamespace(name=f'张三{i}', age=30, gender='男', id_num='110101199001010001', sample_type='骨髓',
+                           sample_quantity='1', date=datetime.datetime(2023, 9, 1, 8, 30), place='北京',
+                           phone='13800000000', serial=f'20230901_BM_{i:03d}', available=True,
+                           create_time=datetime.datetime(2023, 9, 1, 8, 30, 5), update_time=None)
+
+
+def test_donor_to_json():
+    data = json.loads(donor_to_json(make_donor(1)))
+    assert (data['date'], data['create_time'], data['update_time']) == ('2023-09-01', '2023-09-01 08:30:05', None)
+    assert '张三1' in donor_to_json(make_donor(1))
+
+
+@pytest.mark.parametrize('count', [0, 1, 3, 7])
+def test_stream_matches_single_encoding(count):
+    donors = [make_donor(i) for i in range(count)]
+    streamed = ''.join(iter_donors_json(iter(donors), chunk_size=3))
+    assert json.loads(streamed) == json.loads(donors_to_json(donors))
+    assert len(json.loads(streamed)) == count
+
+
+def test_quest_all_streams_json_array():
+    client = main.app.test_client()
+    client.post('/add', json=dict(name='李四', age=40, gender='女', id_num='110101198001010002', sample_type='外周血',
+                                  sample_quantity='2', date='2023-09-02', place='上海', phone='13900000000'))
+    rows = json.loads(client.post('/quest_all').get_data(as_text=True))
+    assert any(row['name'] == '李四' and row['date'] == '2023-09-02' for row in rows)
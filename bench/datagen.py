@@ -0,0 +1,157 @@
+"""
+生成合成的献血者数据，用于基准测试，相同的种子总是生成相同的数据
+
+    python bench/datagen.py --rows 100000 --out bench/data/new-100000.db
+    python bench/datagen.py --rows 100000 --schema legacy --out bench/data/legacy-100000.db
+
+new为new_backend(sql_app)的表结构，legacy为Flask后端(connect_mysql)的表结构
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, Table, create_engine, insert
+from sqlalchemy.orm import Session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 与get_sample_code一致
+SAMPLE_CODES = {
+    "骨髓": "BM",
+    "外周血": "PB",
+    "脐带血": "CB",
+    "脐带": "UC",
+    "其他组织样品": "X"
+}
+SAMPLE_WEIGHTS = [30, 40, 15, 10, 5]
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈"
+GIVEN_CHARS = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超兰霞平刚桂华建国红玉梅林波斌宇浩凯鹏飞欣怡子涵雨萱晨轩"
+PLACES = ["北京协和医院", "上海瑞金医院", "广州中山医院", "南京鼓楼医院", "成都华西医院", "杭州邵逸夫医院",
+          "武汉同济医院", "西安西京医院", "长沙湘雅医院", "天津总医院"]
+REGION_CODES = ["110101", "310104", "440106", "320106", "510107", "330106", "420102", "610113", "430102", "120101"]
+PHONE_PREFIXES = ["130", "131", "132", "135", "136", "137", "138", "139", "150", "151", "158", "159", "177",
+                  "186", "188", "189"]
+ID_WEIGHTS = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
+ID_CHECK_CODES = "10X98765432"
+
+# Flask后端的表结构，避免依赖flask_sqlalchemy
+legacy_metadata = MetaData()
+legacy_donor = Table(
+    "DonorInfo", legacy_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(128)),
+    Column("age", Integer),
+    Column("gender", String(128)),
+    Column("id_num", String(128)),
+    Column("sample_type", String(128)),
+    Column("sample_quantity", String(128)),
+    Column("date", DateTime),
+    Column("place", String(128)),
+    Column("phone", String(128)),
+    Column("serial", String(128)),
+    Column("available", Boolean),
+    Column("create_time", DateTime),
+    Column("update_time", DateTime),
+)
+
+
+def make_id_num(rng: random.Random, birthday: datetime.date):
+    """生成带正确校验位的18位身份证号码"""
+    body = f'{rng.choice(REGION_CODES)}{birthday.strftime("%Y%m%d")}{rng.randrange(1000):03d}'
+    total = sum(int(c) * w for c, w in zip(body, ID_WEIGHTS))
+    return body + ID_CHECK_CODES[total % 11]
+
+
+def iter_donors(rows: int, seed: int, start: datetime.date, days: int):
+    """
+    按采样日期递增生成数据，流水号按(日期, 样品代码)连续编号
+    """
+    rng = random.Random(seed)
+    sample_types = list(SAMPLE_CODES)
+    counters = {}
+    for i in range(rows):
+        day = start + datetime.timedelta(days=i * days // rows)
+        age = rng.randint(18, 60)
+        birthday = day - datetime.timedelta(days=age * 365 + rng.randrange(365))
+        sample_type = rng.choices(sample_types, SAMPLE_WEIGHTS)[0]
+        code = SAMPLE_CODES[sample_type]
+        key = (day.strftime("%Y%m%d"), code)
+        counters[key] = counters.get(key, 0) + 1
+        name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2))))
+        created = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(seconds=rng.randrange(36000))
+        yield {
+            "name": name,
+            "age": age,
+            "gender": rng.choice(("男", "女")),
+            "id_num": make_id_num(rng, birthday),
+            "sample_type": sample_type,
+            "sample_quantity": str(rng.randint(1, 5)),
+            "date": day,
+            "place": rng.choice(PLACES),
+            "phone": rng.choice(PHONE_PREFIXES) + f'{rng.randrange(10 ** 8):08d}',
+            "serial": f'{key[0]}_{code}_{str(counters[key]).rjust(3, "0")}',
+            "available": rng.random() > 0.05,
+            "create_time": created,
+            "update_time": created,
+        }, counters
+
+
+def generate(url: str, rows: int, schema: str = "new", seed: int = 42, days: int = 365 * 3,
+             start: datetime.date = datetime.date(2021, 1, 1), chunk_size: int = 10000):
+    """
+    向url指定的空数据库写入rows条数据
+    """
+    if schema == "new":
+        os.environ.setdefault("DONOR_DATABASE_URL", url)
+        sys.path.insert(0, os.path.join(ROOT, "new_backend"))
+        from sql_app import crud, dedup, migrate, models
+        from sql_app.database import create_db_engine
+
+        engine = create_db_engine(url)
+        migrate.upgrade(engine)
+        table = models.DonorInfo.__table__
+    else:
+        engine = create_engine(url)
+        legacy_metadata.create_all(engine)
+        table = legacy_donor
+    counters = {}
+    chunk = []
+    with engine.begin() as conn:
+        for donor, counters in iter_donors(rows, seed, start, days):
+            if schema == "new":
+                donor["age"] = str(donor["age"])
+                donor.update(dedup.normalized_keys(donor["id_num"], donor["phone"], donor["name"]))
+            else:
+                donor["date"] = datetime.datetime.combine(donor["date"], datetime.time())
+            chunk.append(donor)
+            if len(chunk) >= chunk_size:
+                conn.execute(insert(table), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(insert(table), chunk)
+        if schema == "new" and counters:
+            conn.execute(insert(models.SerialCounter.__table__),
+                         [{"day": day, "sample_code": code, "value": value}
+                          for (day, code), value in counters.items()])
+            crud.rebuild_daily_stats(Session(bind=conn, join_transaction_mode="rollback_only"))
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的献血者数据")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--schema", choices=("new", "legacy"), default="new")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True, help="输出的SQLite文件，不能已存在")
+    args = parser.parse_args()
+    if os.path.exists(args.out):
+        parser.error(f"{args.out}已存在")
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    generate(f"sqlite:///{os.path.abspath(args.out)}", args.rows, schema=args.schema, seed=args.seed)
+    print(f"已生成{args.rows}条数据: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+在进程内对后端接口做基准测试，结果保存为JSON，便于比较不同提交的表现
+
+    python bench/run_bench.py --rows 10000
+    python bench/run_bench.py --rows 100000 --backend flask
+    python bench/run_bench.py --compare bench/results/old.json bench/results/new.json
+
+数据集由datagen生成并缓存在bench/data，每次测试使用其副本，/add写入的数据不会污染数据集。
+fastapi后端需要sql_app/secret_key.py，与正常启动服务时相同。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import datagen
+from loguru import logger
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不记录内存峰值
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+
+def peak_rss_mb():
+    """进程启动以来的内存峰值(MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS单位为字节，Linux为KB
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=ROOT) != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(name, send, iterations, ok=None):
+    """
+    调用send iterations次，send返回响应对象
+    :param ok: 判断响应是否成功，状态码为200但内容为错误提示的接口需传入
+    """
+    latencies = []
+    errors = 0
+    response_bytes = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = send(i)
+        # 流式响应在读取响应体时才真正生成，需计入耗时
+        body = response.data if hasattr(response, "data") else response.content
+        latencies.append(time.perf_counter() - start)
+        response_bytes += len(body)
+        if response.status_code >= 400 or (ok is not None and not ok(response)):
+            errors += 1
+    latencies.sort()
+    total = sum(latencies)
+    result = {
+        "iterations": iterations,
+        "errors": errors,
+        "p50_ms": round(latencies[int(0.50 * (len(latencies) - 1))] * 1000, 3),
+        "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "throughput_rps": round(iterations / total, 2) if total else None,
+        "avg_response_bytes": response_bytes // iterations,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f'{name:<16} p50 {result["p50_ms"]:>10.3f}ms  p99 {result["p99_ms"]:>10.3f}ms  '
+          f'{result["throughput_rps"]:>9} req/s  errors {errors}')
+    return result
+
+
+def sample_donor(rng):
+    """/add请求体"""
+    donor, _ = next(datagen.iter_donors(1, rng.randrange(10 ** 9), datetime.date.today(), 1))
+    donor["age"] = str(donor["age"])
+    donor["date"] = donor["date"].isoformat()
+    for key in ("serial", "available", "create_time", "update_time"):
+        donor.pop(key)
+    return donor
+
+
+def bench_fastapi(db_path, args, rng):
+    os.environ["DONOR_DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.join(ROOT, "new_backend"))
+    from fastapi.testclient import TestClient
+    import main
+    from sql_app import crud
+    from sql_app.database import SessionLocal
+
+    db = SessionLocal()
+    crud.create_user(db, user_name="bench", password="bench", authority=7)
+    db.close()
+    client = TestClient(main.app)
+    login = {"username": "bench", "password": "bench"}
+    token = client.post("/login", data=login).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    start = datetime.date(2021, 1, 1)
+    names = [next(datagen.iter_donors(1, s, start, 1))[0]["name"] for s in range(50)]
+
+    def date_range(i):
+        first = start + datetime.timedelta(days=rng.randrange(365 * 3 - 7))
+        return {"start_time": first.isoformat(), "end_time": (first + datetime.timedelta(days=6)).isoformat()}
+
+    n, full = args.iterations, args.full_iterations
+    return {
+        "login": measure("login", lambda i: client.post("/login", data=login), max(1, n // 5)),
+        "add": measure("add", lambda i: client.post("/add", json=sample_donor(rng), headers=headers), n),
+        "query_all": measure("query_all", lambda i: client.get("/query_all", headers=headers), full),
+        "query_datas": measure("query_datas", lambda i: client.post("/query_datas", json=date_range(i),
+                                                                    headers=headers), n),
+        "fuzzy_query": measure("fuzzy_query", lambda i: client.post(
+            "/fuzzy_query", json={"keyword": "name", "con": names[i % len(names)]}, headers=headers), n),
+        "today_num": measure("today_num", lambda i: client.get("/today_num"), n),
+    }
+
+
+def bench_flask(db_path, args, rng):
+    os.environ["DONOR_DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    import main
+
+    client = main.app.test_client()
+    start = datetime.date(2021, 1, 1)
+    names = [next(datagen.iter_donors(1, s, start, 1))[0]["name"] for s in range(50)]
+    pages = max(1, args.rows // 10)
+
+    def date_range(i):
+        first = start + datetime.timedelta(days=rng.randrange(365 * 3 - 7))
+        return {"start_time": first.isoformat(), "end_time": (first + datetime.timedelta(days=6)).isoformat()}
+
+    n, full = args.iterations, args.full_iterations
+    return {
+        # 写入失败时仍返回200，提示在res中
+        "add": measure("add", lambda i: client.post("/add", json=sample_donor(rng)), n,
+                       ok=lambda response: response.get_json()["res"] == "写入完成"),
+        "quest_all": measure("quest_all", lambda i: client.post("/quest_all"), full),
+        "paginate_query": measure("paginate_query", lambda i: client.post(
+            "/paginate_query", json={"currentPage": rng.randint(1, pages)}), n),
+        "paginate_keyset": measure("paginate_keyset", lambda i: client.post(
+            "/paginate_query", json={"cursor": rng.randint(0, args.rows), "withTotal": True}), n),
+        "query_datas": measure("query_datas", lambda i: client.post("/query_datas", json=date_range(i)), n),
+        "fuzzy_query": measure("fuzzy_query", lambda i: client.post(
+            "/fuzzy_query", json={"attr_name": "name", "con": names[i % len(names)]}), n),
+    }
+
+
+def compare(old_path, new_path):
+    """对比两次结果的p50和p99"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f'{old["meta"]["commit"]} -> {new["meta"]["commit"]}  ({new["meta"]["backend"]}, {new["meta"]["rows"]} rows)')
+    for name, result in new["endpoints"].items():
+        before = old["endpoints"].get(name)
+        if before is None:
+            continue
+        ratios = [f'{key} {before[key]:.3f} -> {result[key]:.3f}ms (x{before[key] / result[key]:.2f})'
+                  for key in ("p50_ms", "p99_ms") if result[key]]
+        print(f'{name:<16} ' + '  '.join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端接口基准测试")
+    parser.add_argument("--backend", choices=("fastapi", "flask"), default="fastapi")
+    parser.add_argument("--rows", type=int, default=10000, help="数据集条数，如10000/100000/1000000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200, help="每个接口的请求次数")
+    parser.add_argument("--full-iterations", type=int, default=5, help="全表查询接口的请求次数")
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两次结果，不运行测试")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    schema = "new" if args.backend == "fastapi" else "legacy"
+    dataset = os.path.join(BENCH_DIR, "data", f"{schema}-{args.rows}-{args.seed}.db")
+    if not os.path.exists(dataset):
+        print(f"生成数据集 {dataset}")
+        # 在子进程中生成，避免本进程提前导入sql_app而连到数据集本身
+        subprocess.check_call([sys.executable, os.path.join(BENCH_DIR, "datagen.py"), "--rows", str(args.rows),
+                               "--schema", schema, "--seed", str(args.seed), "--out", dataset])
+    work_dir = tempfile.mkdtemp(prefix="donor-bench-")
+    db_path = os.path.join(work_dir, "bench.db")
+    shutil.copyfile(dataset, db_path)
+    rng = random.Random(args.seed)
+    # 只保留警告以上的日志，避免输出淹没结果
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    try:
+        if args.backend == "fastapi":
+            endpoints = bench_fastapi(db_path, args, rng)
+        else:
+            endpoints = bench_flask(db_path, args, rng)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "backend": args.backend,
+            "rows": args.rows,
+            "seed": args.seed,
+            "commit": commit,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "endpoints": endpoints,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_file = os.path.join(args.out, f"{args.backend}-{args.rows}-{commit}.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out_file}")
+
+
+if __name__ == "__main__":
+    main()
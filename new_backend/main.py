@@ -1,28 +1,52 @@
-from fastapi import Depends, FastAPI, HTTPException, Form, status
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Body, Depends, FastAPI, File, HTTPException, Form, Query, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import date, datetime, timedelta
 from loguru import logger
 from jose import JWTError, jwt
-from typing import Union
+from typing import Any, Dict, List, Literal, Union
+
+from pydantic import ValidationError
 
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import Session
-from sql_app.database import SessionLocal, engine
-from sql_app import crud, models, schemas
+from sql_app.database import ArchiveSessionLocal, AsyncArchiveSessionLocal, SessionLocal, archive_engine, \
+    async_archive_engine, async_engine, engine, read_router, replica_engines
+from sql_app import archive, async_crud, crud, export, importer, metrics, migrate, schemas
+from sql_app.write_queue import WriteQueue
 
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 
 from sql_app import secret_key
+from sql_app.cache import principal_cache, result_cache, shared_versions
+from sql_app.config import settings
 
 ALGORITHM = "HS256"
 SECRET_KEY = secret_key.secret_key
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-models.Base.metadata.create_all(bind=engine)
+migrate.upgrade(engine, archive_engine)
 
 app = FastAPI()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# bcrypt计算耗时较长，放到独立的线程池中执行，线程数即并发上限
+password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password")
+
+write_queue = WriteQueue(SessionLocal, max_batch=settings.write_queue_max_batch,
+                         max_wait=settings.write_queue_max_wait)
+archive_worker = archive.ArchiveWorker(settings.archive_interval_seconds)
+
 # 跨域
 origins = ["*"]
 app.add_middleware(
@@ -32,6 +56,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 请求耗时和SQL统计，放在最外层以计入所有中间件
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # Dependency
@@ -43,12 +69,81 @@ def get_db():
         db.close()
 
 
+def request_user_name(request: Request):
+    """
+    请求token中的用户名，只用于选择读库，不校验签名，身份仍由get_current_user校验
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+async def get_read_db(request: Request):
+    """
+    只读接口的会话，配置了从库时由read_router选择，开启async_enabled时为AsyncSession，查询统一通过async_crud执行
+    """
+    session_factory, request.state.from_replica = read_router.choose(request_user_name(request))
+    if isinstance(session_factory, async_sessionmaker):
+        async with session_factory() as db:
+            yield db
+    else:
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def get_read_archive_db():
+    if AsyncArchiveSessionLocal is None:
+        db = ArchiveSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    else:
+        async with AsyncArchiveSessionLocal() as db:
+            yield db
+
+
+@app.on_event("startup")
+def start_archive_worker():
+    if settings.archive_interval_seconds > 0:
+        archive_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    # 写完队列中剩余的数据
+    write_queue.stop()
+    archive_worker.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engines():
+    for async_db_engine in {async_engine, async_archive_engine, *replica_engines} - {None}:
+        if not isinstance(async_db_engine, Engine):
+            await async_db_engine.dispose()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome"}
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Prometheus格式的请求和SQL指标"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -62,12 +157,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user(db, user_name=token_data.username)
+    user_version = shared_versions.get("user")
+    if user_version is None:
+        user_version, _ = crud.get_data_version(db, "user")
+        shared_versions.set("user", user_version)
+    cache_key = (token_data.username, token, user_version)
+    user = principal_cache.get(cache_key)
     if user is None:
-        raise credentials_exception
+        db_user = crud.get_user(db, user_name=token_data.username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.UserBase(id=db_user.id, user_name=db_user.user_name, authority=db_user.authority)
+        principal_cache.set(cache_key, user)
     return user
 
 
+async def run_in_password_pool(func, *args):
+    """
+    在密码线程池中执行涉及bcrypt的函数，避免阻塞事件循环
+    """
+    loop = asyncio.get_running_loop()
+    # 复制上下文，使线程中的SQL计入当前请求的统计
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(password_executor, functools.partial(context.run, func, *args))
+
+
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -81,7 +195,7 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
 
 @app.post("/login", response_model=schemas.Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+    user = await run_in_password_pool(crud.authenticate_user, db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
 
@@ -96,6 +210,65 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+async def get_data_version(request: Request):
+    """
+    主库中的数据版本(版本, 最近修改的时间戳)，每个请求只读取一次；从库可能落后，不从从库读取
+    """
+    version = getattr(request.state, "data_version", None)
+    if version is None:
+        if isinstance(read_router.primary, async_sessionmaker):
+            async with read_router.primary() as db:
+                version = await async_crud.run(db, crud.get_data_version)
+        else:
+            with read_router.primary() as db:
+                version = await async_crud.run(db, crud.get_data_version)
+        request.state.data_version = version
+    return version
+
+
+async def replica_may_lag(request: Request):
+    """从库可能还未同步最近的修改，此时的查询结果不缓存，也不返回ETag"""
+    if not getattr(request.state, "from_replica", False):
+        return False
+    _, changed_at = await get_data_version(request)
+    return time.time() - changed_at < settings.read_your_writes_seconds
+
+
+async def cached_json(request: Request, namespace: str, params, compute):
+    """
+    查询结果经缓存后返回，compute为协程函数，返回可被ORJSONResponse编码的数据
+    """
+    if not settings.result_cache_enabled or await replica_may_lag(request):
+        return ORJSONResponse(await compute())
+    version, _ = await get_data_version(request)
+    key = result_cache.make_key(namespace, params, version)
+    body = result_cache.get(key)
+    if body is None:
+        body = ORJSONResponse(await compute()).body
+        result_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
+
+
+async def with_etag(request: Request, namespace: str, params, build):
+    """
+    列表数据的ETag由查询参数和数据版本决定，请求带有相同的If-None-Match时直接返回304，不再查询
+    未开启结果缓存时不使用ETag
+    :param params: 决定查询结果的参数，同cached_json
+    :param build: 协程函数，返回响应对象
+    """
+    if not settings.result_cache_enabled:
+        return await build()
+    version, _ = await get_data_version(request)
+    etag = result_cache.etag(namespace, params, version)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response = await build()
+    if not await replica_may_lag(request):
+        response.headers["ETag"] = etag
+    return response
+
+
 def get_sample_code(sample_type: str):
     """
     根据传入的样品类型返回对应样品代码
@@ -110,53 +283,307 @@ def get_sample_code(sample_type: str):
     return sample_code[sample_type]
 
 
-@app.post("/add")
-async def add_info(new_info: schemas.DonorInfoBase, db: Session = Depends(get_db),
+def add_donor(db: Session, new_info: schemas.DonorInfoBase, sample_code: str):
+    """
+    写入一条数据，流水号在新增数据的同一事务中分配
+    """
+    serial_day = datetime.today().strftime("%Y%m%d")
+    serial_num = crud.allocate_serial(db, serial_day, sample_code)
+    return crud.add_donorInfo(db, name=new_info.name, age=new_info.age, gender=new_info.gender,
+                              id_num=new_info.id_num, sample_type=new_info.sample_type,
+                              sample_quantity=new_info.sample_quantity, date=new_info.date,
+                              place=new_info.place, phone=new_info.phone,
+                              serial=crud.format_serial(serial_day, sample_code, serial_num),
+                              available=True)
+
+
+@app.post("/add", response_model=Union[schemas.DonorInfoOut, str])
+async def add_info(new_info: schemas.DonorInfoBase, check_duplicate: bool = False, db: Session = Depends(get_db),
                    current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    check_duplicate为真时，存在疑似重复的数据则不写入，返回409及候选数据
+    """
     logger.info('用户名为' + str(current_user.user_name))
     logger.info('用户权限为' + str(current_user.authority))
     if current_user.authority >= 2:
-        serial_num = crud.query_today_num(db, new_info.date) + 1
-        res = crud.add_donorInfo(db, name=new_info.name, age=new_info.age, gender=new_info.gender,
-                                 id_num=new_info.id_num, sample_type=new_info.sample_type,
-                                 sample_quantity=new_info.sample_quantity, date=new_info.date,
-                                 place=new_info.place, phone=new_info.phone,
-                                 serial=f'{datetime.today().strftime("%Y%m%d")}_{get_sample_code(new_info.sample_type)}_{str(serial_num).rjust(3, "0")}',
-                                 available=True)
+        if check_duplicate:
+            candidates = await async_crud.run(db, crud.find_duplicate_candidates, name=new_info.name,
+                                              gender=new_info.gender, age=new_info.age, id_num=new_info.id_num,
+                                              phone=new_info.phone)
+            if candidates:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                    detail={"msg": "存在疑似重复的数据", "candidates": jsonable_encoder(candidates)})
+        if settings.write_queue_enabled:
+            # 等待写入期间不占用连接池中的连接
+            db.close()
+            res = await asyncio.wrap_future(write_queue.submit(new_info, get_sample_code(new_info.sample_type)))
+            read_router.mark_write(current_user.user_name)
+            return res
+        res = await async_crud.run(db, add_donor, new_info, get_sample_code(new_info.sample_type))
+        read_router.mark_write(current_user.user_name)
         return res
     else:
         return "权限不足"
 
 
-@app.get("/query_all")
-async def query_all(db: Session = Depends(get_db), current_user: schemas.UserBase = Depends(get_current_user)):
+@app.post("/duplicate_check", response_model=Union[List[schemas.DuplicateCandidate], str])
+async def duplicate_check(item: schemas.DuplicateCheckBase, db: Session = Depends(get_db),
+                          current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    查找疑似重复的数据，按身份证号码、联系电话、姓名+性别+年龄匹配
+    """
+    if current_user.authority >= 1:
+        return await async_crud.run(db, crud.find_duplicate_candidates, **item.model_dump())
+    else:
+        return "权限不足"
+
+
+def import_records(db: Session, records: list):
+    """
+    校验并批量写入(行号, 数据字典)列表，返回逐行结果
+    """
+    results = {}
+    valid = []
+    for row, record in records:
+        try:
+            info = schemas.DonorInfoBase.model_validate(record)
+            valid.append((row, info, get_sample_code(info.sample_type)))
+        except ValidationError as e:
+            errors = "; ".join(f'{".".join(map(str, err["loc"]))}: {err["msg"]}' for err in e.errors())
+            results[row] = {"row": row, "ok": False, "error": errors}
+        except KeyError:
+            results[row] = {"row": row, "ok": False, "error": f"未知样品类型{record.get('sample_type')}"}
+    if valid:
+        serial_day = datetime.today().strftime("%Y%m%d")
+        try:
+            inserted = crud.add_donorInfo_bulk(db, [(info, code) for _, info, code in valid], serial_day)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.exception(e)
+            inserted = None
+        for index, (row, _, _) in enumerate(valid):
+            if inserted is None:
+                results[row] = {"row": row, "ok": False, "error": "写入失败，本批数据均未导入"}
+            else:
+                results[row] = {"row": row, "ok": True, "id": inserted[index][0], "serial": inserted[index][1]}
+    report = [results[row] for row, _ in records]
+    succeeded = sum(1 for r in report if r["ok"])
+    return {"total": len(report), "succeeded": succeeded, "failed": len(report) - succeeded, "results": report}
+
+
+@app.post("/add_batch")
+def add_batch(records: List[Dict[str, Any]] = Body(), db: Session = Depends(get_db),
+              current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    批量录入，请求体为数据字典数组，返回结果中的row为数组下标(从1开始)
+    """
+    logger.info('用户名为' + str(current_user.user_name))
+    logger.info('用户权限为' + str(current_user.authority))
+    if current_user.authority >= 2:
+        if len(records) > settings.import_max_rows:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"单次最多导入{settings.import_max_rows}条")
+        report = import_records(db, list(enumerate(records, start=1)))
+        read_router.mark_write(current_user.user_name)
+        return report
+    else:
+        return "权限不足"
+
+
+@app.post("/import")
+async def import_file(file: UploadFile = File(), db: Session = Depends(get_db),
+                      current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    上传csv或xlsx文件批量录入，第一行为表头，返回结果中的row为表格行号
+    """
+    logger.info('用户名为' + str(current_user.user_name))
+    logger.info('用户权限为' + str(current_user.authority))
+    if current_user.authority >= 2:
+        try:
+            records = importer.parse_donor_file(file.filename or "", await file.read())
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if len(records) > settings.import_max_rows:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"单次最多导入{settings.import_max_rows}条")
+        report = await async_crud.run(db, import_records, records)
+        read_router.mark_write(current_user.user_name)
+        return report
+    else:
+        return "权限不足"
+
+
+# 列表接口直接返回ORJSONResponse，response_model仅用于生成文档，跳过逐行校验
+@app.get("/query_all", response_model=Union[List[schemas.DonorInfoOut], str])
+async def query_all(request: Request, include_archive: bool = False, db=Depends(get_read_db),
+                    archive_db=Depends(get_read_archive_db),
+                    current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    include_archive为真时同时返回归档的数据
+    """
+    if current_user.authority >= 1:
+        async def build():
+            return ORJSONResponse(await async_crud.get_donorInfo_all(db, archive_db if include_archive else None))
+
+        return await with_etag(request, "query_all", include_archive, build)
+    else:
+        return "权限不足"
+
+
+@app.get("/query_page", response_model=Union[schemas.DonorInfoPage, str])
+async def query_page(request: Request, cursor: Union[str, None] = None,
+                     limit: int = Query(default=50, ge=1, le=500), order: Literal["asc", "desc"] = "desc",
+                     db=Depends(get_read_db), current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    游标分页查询，next_cursor为空表示已到最后一页
+    """
     if current_user.authority >= 1:
-        return crud.get_donorInfo_all(db)
+        async def build():
+            try:
+                items, next_cursor = await async_crud.get_donorInfo_page(db, cursor=cursor, limit=limit, order=order)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            return ORJSONResponse({"items": items, "next_cursor": next_cursor})
+
+        return await with_etag(request, "query_page", (cursor, limit, order), build)
     else:
         return "权限不足"
 
 
-@app.post("/query_datas")
-async def query_datas(query_date: schemas.QueryDateBase, db: Session = Depends(get_db),
+@app.post("/query_datas", response_model=Union[List[schemas.DonorInfoOut], str])
+async def query_datas(request: Request, query_date: schemas.QueryDateBase, db=Depends(get_read_db),
+                      archive_db=Depends(get_read_archive_db),
                       current_user: schemas.UserBase = Depends(get_current_user)):
     if current_user.authority >= 1:
-        return crud.query_date(db, start=query_date.start_time, end=query_date.end_time)
+        start, end = query_date.start_time, query_date.end_time
+
+        async def compute():
+            return await async_crud.query_date(db, start=start, end=end,
+                                               archive_db=archive_db if query_date.include_archive else None)
+
+        params = (start, end, query_date.include_archive)
+        return await with_etag(request, "query_date", params,
+                               lambda: cached_json(request, "query_date", params, compute))
     else:
         return "权限不足"
 
 
-@app.post("/fuzzy_query")
-async def fuzzy_query(keyword: schemas.FuzzyKeywordBase, db: Session = Depends(get_db),
+@app.post("/fuzzy_query", response_model=Union[List[schemas.DonorInfoOut], str])
+async def fuzzy_query(request: Request, keyword: schemas.FuzzyKeywordBase, db=Depends(get_read_db),
+                      archive_db=Depends(get_read_archive_db),
                       current_user: schemas.UserBase = Depends(get_current_user)):
     if current_user.authority >= 1:
-        return crud.fuzzy_query_donorInfo(db, attr_name=keyword.keyword, con=keyword.con)
+        async def compute():
+            return await async_crud.fuzzy_query_donorInfo(
+                db, attr_name=keyword.keyword, con=keyword.con, limit=keyword.limit,
+                archive_db=archive_db if keyword.include_archive else None)
+
+        params = (keyword.keyword, keyword.con, keyword.limit, keyword.include_archive)
+        try:
+            return await with_etag(request, "fuzzy_query", params,
+                                   lambda: cached_json(request, "fuzzy_query", params, compute))
+        except KeyError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"未知字段{keyword.keyword}")
+    else:
+        return "权限不足"
+
+
+@app.post("/search", response_model=Union[schemas.SearchResult, str])
+async def search(request: Request, query: schemas.SearchQuery, db=Depends(get_read_db),
+                 archive_db=Depends(get_read_archive_db),
+                 current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    组合多个字段的条件查询，所有条件同时满足
+    """
+    if current_user.authority >= 1:
+        async def compute():
+            items, total, is_estimate = await async_crud.search_donorInfo(
+                db, query, archive_db=archive_db if query.include_archive else None)
+            return {"items": items, "total": total, "total_is_estimate": is_estimate}
+
+        params = query.model_dump_json()
+        try:
+            return await with_etag(request, "search", params,
+                                   lambda: cached_json(request, "search", params, compute))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        return "权限不足"
+
+
+@app.get("/changes", response_model=Union[schemas.DonorChanges, str])
+async def get_changes(since: Union[str, None] = None, limit: int = Query(default=500, ge=1, le=5000),
+                      db=Depends(get_read_db), current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    增量同步，返回since水位之后新增或修改的数据，不带since时从头开始
+    客户端保存返回的watermark，has_more为真时继续请求
+    """
+    if current_user.authority >= 1:
+        try:
+            items, watermark, has_more = await async_crud.get_donorInfo_changes(
+                db, since=since, limit=limit, settle_seconds=settings.changes_settle_seconds)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return ORJSONResponse({"items": items, "watermark": watermark, "has_more": has_more})
+    else:
+        return "权限不足"
+
+
+@app.get("/export")
+async def export_datas(fmt: Literal["ndjson", "csv"] = "ndjson",
+                       start_time: Union[date, None] = None, end_time: Union[date, None] = None,
+                       keyword: Union[str, None] = None, con: Union[str, None] = None,
+                       db: Session = Depends(get_db),
+                       current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    流式导出数据，可按时间段(start_time, end_time)和模糊条件(keyword, con)筛选
+    """
+    if current_user.authority >= 1:
+        try:
+            if keyword is not None:
+                crud.choose_attr(keyword)
+        except KeyError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"未知字段{keyword}")
+        rows = crud.iter_donorInfo(db, start=start_time, end=end_time, attr_name=keyword, con=con)
+        if fmt == "csv":
+            return StreamingResponse(export.iter_csv(rows), media_type="text/csv",
+                                     headers={"Content-Disposition": "attachment; filename=donors.csv"})
+        return StreamingResponse(export.iter_ndjson(rows), media_type="application/x-ndjson")
+    else:
+        return "权限不足"
+
+
+@app.get("/stats")
+async def get_stats(start_time: date, end_time: date,
+                    group_by: List[Literal["day", "sample_type", "place", "available"]] = Query(default=["day"]),
+                    db=Depends(get_read_db),
+                    current_user: schemas.UserBase = Depends(get_current_user)):
+    """
+    从每日统计表查询时间段内的数量，可按日期、样品类型、采样地点、是否可用分组
+    """
+    if current_user.authority >= 1:
+        group_by = [name for name in crud.STATS_GROUPS if name in group_by]
+        return ORJSONResponse(await async_crud.query_stats(db, start=start_time, end=end_time, group_by=group_by))
+    else:
+        return "权限不足"
+
+
+@app.post("/change_available")
+def change_available(donor: schemas.DonorAvailableBase, db: Session = Depends(get_db),
+                     current_user: schemas.UserBase = Depends(get_current_user)):
+    logger.info('用户名为' + str(current_user.user_name))
+    logger.info('用户权限为' + str(current_user.authority))
+    if current_user.authority >= 2:
+        res = crud.set_donorInfo_available(db, donor_id=donor.id, available=donor.available)
+        read_router.mark_write(current_user.user_name)
+        return res
     else:
         return "权限不足"
 
 
 @app.get("/today_num")
-async def get_today_num(today: str = str(date.today()), db: Session = Depends(get_db)):
-    return crud.query_today_num(db, today)
+async def get_today_num(today: Union[date, None] = None, db=Depends(get_read_db)):
+    return await async_crud.query_today_num(db, today or date.today())
 
 
 @app.post("/user/create_user")
@@ -166,7 +593,7 @@ async def create_user(username: str = Form(), password: str = Form(), authority:
     logger.info('用户名为' + str(current_user.user_name))
     logger.info('用户权限为' + str(current_user.authority))
     if current_user.authority >= 4:
-        res = crud.create_user(db, user_name=username, password=password, authority=authority)
+        res = await run_in_password_pool(crud.create_user, db, username, password, authority)
         return res
     else:
         return "权限不足"
@@ -184,8 +611,8 @@ async def read_user_me(current_user: schemas.UserBase = Depends(get_current_user
 
 
 @app.get("/user/get_all")
-async def get_all_user(db: Session = Depends(get_db),
-                       current_user: schemas.UserBase = Depends(get_current_user)):
+def get_all_user(db: Session = Depends(get_db),
+                 current_user: schemas.UserBase = Depends(get_current_user)):
     logger.info('用户名为' + str(current_user.user_name))
     logger.info('用户权限为' + str(current_user.authority))
     if current_user.authority >= 4:
@@ -199,8 +626,8 @@ async def get_all_user(db: Session = Depends(get_db),
 
 
 @app.post("/user/change_authority")
-async def change_authority(user: schemas.UserBase, db: Session = Depends(get_db),
-                           current_user: schemas.UserBase = Depends(get_current_user)):
+def change_authority(user: schemas.UserBase, db: Session = Depends(get_db),
+                     current_user: schemas.UserBase = Depends(get_current_user)):
     logger.info('用户名为' + str(current_user.user_name))
     logger.info('用户权限为' + str(current_user.authority))
     if current_user.authority >= 4:
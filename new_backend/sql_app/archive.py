@@ -0,0 +1,155 @@
+"""
+冷热数据归档
+
+把较早的数据和已不可用的数据分批移入DonorInfoArchive，日常查询只扫描仍在使用的数据。
+归档表可以放在单独的数据库文件中(archive_database_url)，每批先写归档表再删除DonorInfo中的数据，
+中途失败时重新运行即可，已在归档表中的数据不会重复写入。每日统计仍包含归档的数据。
+
+    python -m sql_app.archive
+"""
+import datetime
+import threading
+
+from loguru import logger
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .config import settings
+from .database import ArchiveSessionLocal, SessionLocal, archive_engine, engine
+
+
+def archive_condition(after_days: int, unavailable_after_days: int):
+    """需要归档的数据的条件，两个天数都为0时返回None"""
+    donor = models.DonorInfo
+    conditions = []
+    if after_days > 0:
+        conditions.append(donor.date < datetime.date.today() - datetime.timedelta(days=after_days))
+    if unavailable_after_days > 0:
+        conditions.append(and_(donor.available.is_(False), donor.update_time <
+                               datetime.datetime.now() - datetime.timedelta(days=unavailable_after_days)))
+    return or_(*conditions) if conditions else None
+
+
+def archive_batch(db: Session, archive_db: Session, condition, batch_size: int):
+    """
+    移动一批数据，archive_db与db为同一会话时在一个事务中完成
+    :return: 移动的条数
+    """
+    hot = models.DonorInfo.__table__
+    cold = models.DonorInfoArchive.__table__
+    rows = [dict(r) for r in db.execute(select(hot).where(condition).order_by(hot.c.id).limit(batch_size))
+            .mappings()]
+    if not rows:
+        return 0
+    by_id = {r['id']: r for r in rows}
+    existing = set()
+    for archived in archive_db.execute(select(cold.c.id, cold.c.serial, cold.c.create_time)
+                                       .where(cold.c.id.in_(by_id))):
+        row = by_id[archived.id]
+        # 上次归档中途失败时已写入归档表的数据可以直接删除，id相同但不是同一条数据时不能删除
+        if (archived.serial, archived.create_time) != (row['serial'], row['create_time']):
+            raise RuntimeError(f'DonorInfo id={archived.id} 与归档表中的另一条数据id相同，已停止归档')
+        existing.add(archived.id)
+    archived_at = datetime.datetime.now()
+    new_rows = [dict(r, archived_at=archived_at) for r in rows if r['id'] not in existing]
+    if new_rows:
+        archive_db.execute(insert(cold), new_rows)
+    if archive_db is not db:
+        archive_db.commit()
+    db.execute(delete(hot).where(hot.c.id.in_(by_id)))
+    crud.commit_donor_changes(db)
+    return len(rows)
+
+
+def archive_donors(db: Session, archive_db: Session, after_days: int = None, unavailable_after_days: int = None,
+                   batch_size: int = None, max_batches: int = None):
+    """
+    按配置归档，每批单独提交，避免长时间持有写锁
+    :return: 移动的总条数
+    """
+    condition = archive_condition(settings.archive_after_days if after_days is None else after_days,
+                                  settings.archive_unavailable_after_days if unavailable_after_days is None
+                                  else unavailable_after_days)
+    if condition is None:
+        return 0
+    batch_size = batch_size or settings.archive_batch_size
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(db, archive_db, condition, batch_size)
+        if moved == 0:
+            break
+        total += moved
+        batches += 1
+    return total
+
+
+def open_sessions():
+    """(DonorInfo会话, 归档会话)，归档表在同一数据库时共用一个会话"""
+    db = SessionLocal()
+    return db, (db if archive_engine is engine else ArchiveSessionLocal())
+
+
+class ArchiveWorker:
+    """后台定时归档的线程"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='archive', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db, archive_db = open_sessions()
+            try:
+                # 每批之间检查是否需要停止
+                while not self._stop.is_set():
+                    moved = archive_donors(db, archive_db, max_batches=1)
+                    if moved == 0:
+                        break
+                    logger.info(f'已归档{moved}条数据')
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                db.close()
+                archive_db.close()
+
+
+def merge_sorted(hot: list, cold: list, sort, limit: int = None):
+    """合并DonorInfo和归档表的结果，按sort重新排序，相同id以DonorInfo中的为准"""
+    ids = {row['id'] for row in hot}
+    rows = crud.sort_rows(hot + [row for row in cold if row['id'] not in ids], sort)
+    return rows if limit is None else rows[:limit]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from .migrate import upgrade
+
+    parser = argparse.ArgumentParser(description='把较早的和不可用的数据移入归档表')
+    parser.add_argument('--after-days', type=int, default=settings.archive_after_days,
+                        help='采样日期早于该天数的数据，0为不按采样日期归档')
+    parser.add_argument('--unavailable-after-days', type=int, default=settings.archive_unavailable_after_days,
+                        help='不可用且该天数内未修改的数据，0为不归档不可用的数据')
+    parser.add_argument('--batch-size', type=int, default=settings.archive_batch_size)
+    args = parser.parse_args()
+    upgrade(engine, archive_engine)
+    db, archive_db = open_sessions()
+    try:
+        moved = archive_donors(db, archive_db, after_days=args.after_days,
+                               unavailable_after_days=args.unavailable_after_days, batch_size=args.batch_size)
+    finally:
+        db.close()
+        archive_db.close()
+    logger.info(f'共归档{moved}条数据')
@@ -0,0 +1,81 @@
+"""
+只读查询的异步版本
+
+开启async_enabled时会话为AsyncSession，crud中的函数通过run_sync在异步驱动上执行；
+未开启时会话为普通Session，放到线程池中执行。两种方式都不会阻塞事件循环，
+一个慢查询不会拖住同一worker上的其他请求。互不依赖的查询(如DonorInfo和归档表)使用各自的会话同时执行。
+"""
+import asyncio
+import contextvars
+import datetime
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import archive, crud, models, schemas
+
+
+async def run(db: AsyncSession | Session, func, *args, **kwargs):
+    """
+    执行同步的crud函数，func的第一个参数为同步Session
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(lambda session: func(session, *args, **kwargs))
+    loop = asyncio.get_running_loop()
+    # 复制上下文，使线程中的SQL计入当前请求的统计
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, db, *args, **kwargs))
+
+
+async def with_archive(db, archive_db, func, *args, **kwargs):
+    """同时查询DonorInfo和归档表，返回(DonorInfo的结果, 归档表的结果)"""
+    return await asyncio.gather(run(db, func, *args, **kwargs),
+                                run(archive_db, func, *args, model=models.DonorInfoArchive, **kwargs))
+
+
+async def get_donorInfo_all(db, archive_db=None):
+    if archive_db is None:
+        return await run(db, crud.get_donorInfo_all)
+    hot, cold = await with_archive(db, archive_db, crud.get_donorInfo_all)
+    return archive.merge_sorted(hot, cold, ['id'])
+
+
+async def get_donorInfo_page(db, cursor: str | None = None, limit: int = 50, order: str = "desc"):
+    return await run(db, crud.get_donorInfo_page, cursor=cursor, limit=limit, order=order)
+
+
+async def query_date(db, start: datetime.date, end: datetime.date, archive_db=None):
+    if archive_db is None:
+        return await run(db, crud.query_date, start, end)
+    hot, cold = await with_archive(db, archive_db, crud.query_date, start, end)
+    return archive.merge_sorted(hot, cold, ['-date'])
+
+
+async def fuzzy_query_donorInfo(db, attr_name: str | None, con: str, limit: int = 100, archive_db=None):
+    if archive_db is None:
+        return await run(db, crud.fuzzy_query_donorInfo, attr_name, con, limit)
+    # 同时查询，DonorInfo中的结果在前
+    hot, cold = await with_archive(db, archive_db, crud.fuzzy_query_donorInfo, attr_name, con, limit)
+    return (hot + cold)[:limit]
+
+
+async def search_donorInfo(db, query: schemas.SearchQuery, archive_db=None):
+    if archive_db is None:
+        return await run(db, crud.search_donorInfo, query)
+    (hot, hot_total, hot_estimate), (cold, cold_total, cold_estimate) = \
+        await with_archive(db, archive_db, crud.search_donorInfo, query)
+    return (archive.merge_sorted(hot, cold, query.sort, query.limit), hot_total + cold_total,
+            hot_estimate or cold_estimate)
+
+
+async def get_donorInfo_changes(db, since: str | None = None, limit: int = 500, settle_seconds: float = 2):
+    return await run(db, crud.get_donorInfo_changes, since=since, limit=limit, settle_seconds=settle_seconds)
+
+
+async def query_stats(db, start: datetime.date, end: datetime.date, group_by=('day',)):
+    return await run(db, crud.query_stats, start, end, group_by)
+
+
+async def query_today_num(db, today: datetime.date):
+    return await run(db, crud.query_today_num, today)
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import settings
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    线程安全的LRU缓存，超过maxsize时淘汰最久未使用的条目，ttl(秒)不为None时条目到期失效
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expire_at = item
+            if expire_at is not None and expire_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expire_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryCacheBackend:
+    """
+    进程内缓存，多个worker时各自缓存
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value: bytes):
+        self._cache.set(key, value)
+
+
+class SQLiteCacheBackend:
+    """
+    基于本地SQLite文件的缓存，同一台机器上的多个worker共享缓存内容
+    """
+
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                     '(key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed ON cache_entry (accessed)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE cache_entry SET accessed = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def set(self, key, value: bytes):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache_entry VALUES (?, ?, ?)', (key, value, time.time()))
+        # 超出容量时淘汰最久未访问的条目
+        conn.execute('DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry ORDER BY accessed '
+                     'LIMIT max((SELECT count(*) FROM cache_entry) - ?, 0))', (self.maxsize,))
+
+
+class ResultCache:
+    """
+    查询结果缓存，缓存的是编码后的响应体
+    键中包含数据库中的数据版本(见crud.get_data_version)，任一进程提交修改后版本加一，
+    旧条目不会再被命中，随后被LRU淘汰
+    """
+
+    def __init__(self, backend, max_item_bytes: int):
+        self.backend = backend
+        self.max_item_bytes = max_item_bytes
+
+    @staticmethod
+    def make_key(namespace: str, params, version: int):
+        """
+        :param params: 决定查询结果的参数，需有稳定的repr
+        :param version: 查询前读取的数据版本，查询期间数据被修改时结果存在旧版本下，不会被之后的请求命中
+        """
+        return f'{namespace}:{version}:{params!r}'
+
+    @classmethod
+    def etag(cls, namespace: str, params, version: int):
+        """由缓存键生成的弱ETag，参数或数据版本不同时ETag不同"""
+        digest = hashlib.blake2b(cls.make_key(namespace, params, version).encode(), digest_size=12).hexdigest()
+        return f'W/"{digest}"'
+
+    def get(self, key: str):
+        return self.backend.get(key)
+
+    def set(self, key: str, value: bytes):
+        if len(value) <= self.max_item_bytes:
+            self.backend.set(key, value)
+
+
+def create_result_cache():
+    """根据配置创建结果缓存，result_cache_backend为memory或sqlite:///文件路径"""
+    if settings.result_cache_backend.startswith('sqlite:///'):
+        path = settings.result_cache_backend[len('sqlite:///'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        backend = SQLiteCacheBackend(path, maxsize=settings.result_cache_size)
+    elif settings.result_cache_backend == 'memory':
+        backend = MemoryCacheBackend(maxsize=settings.result_cache_size)
+    else:
+        raise ValueError(f'未知的缓存后端: {settings.result_cache_backend}')
+    return ResultCache(backend, max_item_bytes=settings.result_cache_max_item_bytes)
+
+
+result_cache = create_result_cache()
+
+# 已认证用户缓存，键为(用户名, token, 用户数据版本)，值为schemas.UserBase
+# 修改用户时crud清空本进程的缓存，并把数据库中的用户数据版本加一，其他worker最迟在下次读取版本后不再命中旧条目
+principal_cache = LRUCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+# 从数据库读取的数据版本，到期后重新读取，键为DataVersion.name
+shared_versions = LRUCache(maxsize=16, ttl=settings.principal_version_check_seconds)
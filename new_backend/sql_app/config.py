@@ -0,0 +1,69 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    服务配置，可通过环境变量(前缀DONOR_)或.env文件覆盖，如DONOR_DATABASE_URL=mysql+pymysql://...
+    """
+    model_config = SettingsConfigDict(env_prefix='DONOR_', env_file='.env', extra='ignore')
+
+    # 数据库连接
+    database_url: str = "sqlite:///./test.db"
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_recycle: int = 3600
+    pool_pre_ping: bool = False
+
+    # 只读接口使用异步引擎(需安装aiosqlite/asyncmy/asyncpg)，async_database_url为空时按database_url推断驱动
+    async_enabled: bool = False
+    async_database_url: str = ""
+    # 只读从库，多个地址用逗号分隔，只读接口轮流使用；为空时所有查询都走主库(database_url)
+    replica_database_urls: str = ""
+    # 用户写入后该秒数内其读请求仍走主库；数据修改后该秒数内从库的查询结果不缓存，应大于从库的复制延迟
+    read_your_writes_seconds: float = 5
+
+    # 仅对SQLite生效的PRAGMA，WAL模式下读写互不阻塞
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    # 负数单位为KiB
+    sqlite_cache_size: int = -64000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # 等待写锁的毫秒数
+    sqlite_busy_timeout: int = 5000
+    # 多个worker同时启动时，等待其他worker完成数据库升级的秒数
+    migration_lock_timeout: float = 600
+
+    # 密码哈希和校验(bcrypt)的线程数，即同时进行的登录校验上限
+    password_hash_workers: int = 4
+    # 已认证用户缓存
+    principal_cache_size: int = 1024
+    principal_cache_ttl: float = 60
+    # 每隔该秒数从数据库读取一次用户数据版本，其他worker修改用户后最迟该秒数生效
+    principal_version_check_seconds: float = 1
+    # 时间段和模糊查询结果缓存，多个worker时可使用sqlite:///./cache.db共享缓存内容
+    result_cache_enabled: bool = True
+    result_cache_backend: str = "memory"
+    result_cache_size: int = 256
+    result_cache_max_item_bytes: int = 4 * 1024 * 1024
+    # /add合并写入: 开启后由单个写线程每max_batch条或每max_wait秒合并提交一次
+    write_queue_enabled: bool = False
+    write_queue_max_batch: int = 100
+    write_queue_max_wait: float = 0.01
+    # 归档: 采样日期早于archive_after_days天，或已不可用且archive_unavailable_after_days天未修改的数据
+    # 移入归档表，天数为0时不按该条件归档；archive_database_url为空时归档表与DonorInfo在同一数据库
+    archive_database_url: str = ""
+    archive_after_days: int = 730
+    archive_unavailable_after_days: int = 30
+    archive_batch_size: int = 1000
+    # 后台归档的间隔秒数，0为不在后台运行，只能通过python -m sql_app.archive手动归档
+    archive_interval_seconds: float = 0
+    # /changes不返回最近这些秒内的修改，等待可能仍未提交的事务
+    changes_settle_seconds: float = 2
+    # 是否提供/metrics
+    metrics_enabled: bool = True
+    # 批量导入单次最多行数
+    import_max_rows: int = 5000
+
+
+settings = Settings()
@@ -1,38 +1,344 @@
+import base64
+import binascii
+import datetime
+import json
+import secrets
+import time
+from functools import lru_cache
+
+from sqlalchemy import Boolean, Date, DateTime, Integer, and_, column, func, insert, inspect, or_, select, table, \
+    text, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
 from passlib.context import CryptContext
 
-from . import models, schemas
+from . import dedup, models, schemas
+from .cache import principal_cache, shared_versions
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# 对外输出的DonorInfo字段
+DONOR_FIELDS = ('id', 'name', 'age', 'gender', 'id_num', 'sample_type', 'sample_quantity', 'date', 'place', 'phone',
+                'serial', 'available', 'create_time', 'update_time')
+
+
+def donor_columns(model=models.DonorInfo):
+    """对外输出的列，model为DonorInfo或DonorInfoArchive"""
+    return [getattr(model, name) for name in DONOR_FIELDS]
+
+
+DONOR_COLUMNS = donor_columns()
+
 
 def add_donorInfo(db: Session, name, age, gender, id_num, sample_type,
                   sample_quantity, date, place, phone, serial, available):
     db_info = models.DonorInfo(name=name, age=age, gender=gender, id_num=id_num, sample_type=sample_type,
                                sample_quantity=sample_quantity, date=date, place=place,
-                               phone=phone, serial=serial, available=available)
+                               phone=phone, serial=serial, available=available,
+                               **dedup.normalized_keys(id_num, phone, name))
     db.add(db_info)
-    db.commit()
+    bump_daily_stats(db, [(date, sample_type, place, available)], 1)
+    commit_donor_changes(db)
     db.refresh(db_info)
     return db_info
 
 
+def get_data_version(db: Session, name: str = 'donor'):
+    """
+    :return: (数据版本, 最近修改的时间戳)，从未修改过时为(0, 0.0)
+    """
+    version = models.DataVersion
+    row = db.execute(select(version.value, version.changed_at).where(version.name == name)).first()
+    return (0, 0.0) if row is None else tuple(row)
+
+
+def bump_data_version(db: Session, name: str = 'donor'):
+    """数据版本加一，不提交事务，需与修改在同一事务中提交"""
+    version = models.DataVersion
+    res = db.execute(update(version).where(version.name == name)
+                     .values(value=version.value + 1, changed_at=time.time()))
+    if res.rowcount == 0:
+        # 从随机值开始，重建数据库后版本不会与之前的相同
+        upsert_increment(db, version, {'name': name}, 'value', 1, initial=secrets.randbits(31))
+
+
+def commit_donor_changes(db: Session):
+    """提交对DonorInfo的修改，数据版本在同一事务中加一，使所有进程的查询结果缓存失效"""
+    bump_data_version(db)
+    db.commit()
+
+
+def stats_key(day, sample_type, place, available):
+    """统计表主键，空值统一处理，采样日期为空的数据不计入统计"""
+    if day is None:
+        return None
+    return day, sample_type or '', place or '', bool(available)
+
+
+def bump_daily_stats(db: Session, rows, delta: int):
+    """
+    按(采样日期, 样品类型, 采样地点, 是否可用)累加统计，不提交事务
+    :param rows: (采样日期, 样品类型, 采样地点, 是否可用)列表
+    """
+    counts = {}
+    for row in rows:
+        key = stats_key(*row)
+        if key is not None:
+            counts[key] = counts.get(key, 0) + delta
+    stats = models.DailyStats
+    rows = [{'day': day, 'sample_type': sample_type, 'place': place, 'available': available, 'count': amount}
+            for (day, sample_type, place, available), amount in counts.items()]
+    upsert_add(db, stats, rows, STATS_GROUPS, 'count')
+    for row in rows:
+        if row['count'] < 0:
+            # 与重新生成的结果保持一致，不保留计数为0的行
+            db.execute(stats.__table__.delete().where(
+                *(getattr(stats, k) == row[k] for k in STATS_GROUPS)).where(stats.count <= 0))
+
+
+def set_donorInfo_available(db: Session, donor_id: int, available: bool):
+    """
+    修改数据是否可用，并同步更新统计
+    :return: 是否有数据被修改
+    """
+    donor = models.DonorInfo
+    while True:
+        row = db.execute(select(donor.date, donor.sample_type, donor.place, donor.available)
+                         .where(donor.id == donor_id)).first()
+        if row is None or row.available is available:
+            db.rollback()
+            return False
+        # 原值为空时统计中计为不可用，按读到的原值更新，期间被其他请求修改时重新读取
+        old = donor.available.is_(None) if row.available is None else donor.available == row.available
+        res = db.execute(update(donor).where(donor.id == donor_id).where(old).values(available=available))
+        if res.rowcount == 1:
+            break
+        db.rollback()
+    bump_daily_stats(db, [(row.date, row.sample_type, row.place, row.available)], -1)
+    bump_daily_stats(db, [(row.date, row.sample_type, row.place, available)], 1)
+    commit_donor_changes(db)
+    return True
+
+
+def rebuild_daily_stats(db: Session, archive_db: Session = None):
+    """
+    根据DonorInfo重新生成每日统计
+    :param archive_db: 归档数据库的会话，传入时归档的数据同样计入统计
+    """
+    donor = models.DonorInfo
+    stats = models.DailyStats
+    available = func.coalesce(donor.available, False)
+    sample_type = func.coalesce(donor.sample_type, '')
+    place = func.coalesce(donor.place, '')
+    db.execute(stats.__table__.delete())
+    db.execute(insert(stats).from_select(
+        ['day', 'sample_type', 'place', 'available', 'count'],
+        select(donor.date, sample_type, place, available, func.count())
+        .where(donor.date.is_not(None)).group_by(donor.date, sample_type, place, available)))
+    if archive_db is not None:
+        archive = models.DonorInfoArchive
+        rows = archive_db.execute(
+            select(archive.date, archive.sample_type, archive.place, archive.available, func.count())
+            .where(archive.date.is_not(None))
+            .group_by(archive.date, archive.sample_type, archive.place, archive.available))
+        upsert_add(db, stats, [dict(zip(STATS_GROUPS, stats_key(*key)), count=count) for *key, count in rows],
+                   STATS_GROUPS, 'count')
+    db.commit()
+
+
+STATS_GROUPS = ('day', 'sample_type', 'place', 'available')
+
+
+def query_stats(db: Session, start: datetime.date, end: datetime.date, group_by=('day',)):
+    """
+    从统计表查询时间段内的数量，按group_by中的字段分组
+    """
+    stats = models.DailyStats
+    columns = [getattr(stats, name) for name in group_by]
+    stmt = select(*columns, func.sum(stats.count).label('count')) \
+        .where(stats.day >= start, stats.day < end + datetime.timedelta(days=1)) \
+        .group_by(*columns).order_by(*columns)
+    return rows_to_dicts(db.execute(stmt))
+
+
+def upsert_increment(db: Session, model, keys: dict, field: str, amount: int, initial=None):
+    """
+    按主键插入一行，已存在时把field累加amount，由数据库的upsert保证多进程并发安全
+    :param initial: 首次插入时field的值，默认等于amount
+    """
+    table = model.__table__
+    values = dict(keys, **{field: amount if initial is None else initial})
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(values).on_duplicate_key_update({field: table.c[field] + amount})
+    else:
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(values).on_conflict_do_update(
+            index_elements=list(keys), set_={field: table.c[field] + amount})
+    db.execute(stmt)
+
+
+def upsert_add(db: Session, model, rows: list, key_names, field: str):
+    """
+    批量按主键插入，已存在时把field加上要插入的值，所有行在一条语句中执行
+    :param rows: 包含主键和field的字典列表
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update({field: table.c[field] + stmt.inserted[field]})
+    else:
+        stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(table)
+        stmt = stmt.on_conflict_do_update(index_elements=list(key_names),
+                                          set_={field: table.c[field] + stmt.excluded[field]})
+    db.execute(stmt, rows)
+
+
+def allocate_serial(db: Session, day: str, sample_code: str, count: int = 1):
+    """
+    分配流水号，不提交事务，需与新增数据在同一事务中提交
+    计数行在事务结束前保持写锁，多个worker进程并发时不会拿到重复号码
+    :param day: 流水号中的日期，如20230901
+    :param count: 一次分配的个数
+    :return: 分配到的最后一个序号，本次分配范围为[返回值-count+1, 返回值]
+    """
+    counter = models.SerialCounter
+    key = and_(counter.day == day, counter.sample_code == sample_code)
+    res = db.execute(update(counter).where(key).values(value=counter.value + count))
+    if res.rowcount == 0:
+        # 当天该样品的第一个号码，从已存在的同前缀流水号的最大序号开始，兼容启用计数器之前录入的数据(序号可能不连续)
+        upsert_increment(db, counter, {'day': day, 'sample_code': sample_code}, 'value', count,
+                         initial=max_serial_num(db, day, sample_code) + count)
+    return db.execute(select(counter.value).where(key)).scalar_one()
+
+
+def format_serial(day: str, sample_code: str, num: int):
+    """流水号格式: 日期_样品代码_当日序号"""
+    return f'{day}_{sample_code}_{str(num).rjust(3, "0")}'
+
+
+def parse_serial(serial: str | None):
+    """
+    :return: (日期, 样品代码, 序号)，不是该格式时为None；重复后加了后缀的流水号(如20230901_BM_003_17)取原序号
+    """
+    parts = (serial or '').split('_')
+    if len(parts) < 3 or not parts[2].isdigit():
+        return None
+    return parts[0], parts[1], int(parts[2])
+
+
+def max_serial_num(db: Session, day: str, sample_code: str):
+    """已存在的该日期、样品代码的流水号中最大的序号，没有时为0"""
+    serial = models.DonorInfo.serial
+    nums = [parsed[2] for parsed in map(parse_serial, db.scalars(
+        select(serial).where(serial.startswith(f'{day}_{sample_code}_', autoescape=True))))
+        if parsed is not None]
+    return max(nums, default=0)
+
+
+def raise_serial_counters(db: Session, serials):
+    """
+    写入已有流水号的数据(如导入)后，把已存在的计数调到不小于其中每个日期、样品代码的最大序号，不提交事务
+    没有计数行的日期、样品代码不需处理，首次分配时会从已存在的最大序号开始
+    """
+    highest = {}
+    for parsed in map(parse_serial, serials):
+        if parsed is not None:
+            day, code, num = parsed
+            highest[day, code] = max(highest.get((day, code), 0), num)
+    counter = models.SerialCounter
+    for (day, code), num in highest.items():
+        db.execute(update(counter).where(counter.day == day, counter.sample_code == code, counter.value < num)
+                   .values(value=num))
+
+
+def add_donorInfo_bulk(db: Session, infos: list, day: str):
+    """
+    批量新增数据，按样品代码一次性分配流水号，在同一事务中批量插入
+    :param infos: (schemas.DonorInfoBase, 样品代码)列表
+    :param day: 流水号中的日期
+    :return: 与infos顺序一致的(id, 流水号)列表
+    """
+    counts = {}
+    for _, sample_code in infos:
+        counts[sample_code] = counts.get(sample_code, 0) + 1
+    next_num = {}
+    for sample_code, count in counts.items():
+        next_num[sample_code] = allocate_serial(db, day, sample_code, count=count) - count + 1
+    rows = []
+    for info, sample_code in infos:
+        row = info.model_dump(exclude={'id'})
+        row['serial'] = format_serial(day, sample_code, next_num[sample_code])
+        row['available'] = True
+        row.update(dedup.normalized_keys(row['id_num'], row['phone'], row['name']))
+        next_num[sample_code] += 1
+        rows.append(row)
+    # MySQL不支持RETURNING，流水号唯一，写入后按流水号读回id
+    db.execute(insert(models.DonorInfo), rows)
+    serials = [r['serial'] for r in rows]
+    ids = dict(db.execute(select(models.DonorInfo.serial, models.DonorInfo.id)
+                          .where(models.DonorInfo.serial.in_(serials))).all())
+    bump_daily_stats(db, [(r['date'], r['sample_type'], r['place'], r['available']) for r in rows], 1)
+    commit_donor_changes(db)
+    return [(ids[serial], serial) for serial in serials]
+
+
+def find_duplicate_candidates(db: Session, name=None, gender=None, age=None, id_num=None, phone=None,
+                              exclude_id: int = None, limit: int = 20):
+    """
+    按规范化的身份证号码、联系电话以及姓名+性别+年龄查找疑似重复的数据，每项都是索引查找
+    :return: 数据字典列表，matched为匹配依据
+    """
+    keys = dedup.normalized_keys(id_num, phone, name)
+    checks = []
+    if keys['id_num_norm']:
+        checks.append(('id_num', models.DonorInfo.id_num_norm == keys['id_num_norm']))
+    if keys['phone_norm']:
+        checks.append(('phone', models.DonorInfo.phone_norm == keys['phone_norm']))
+    if keys['name_norm'] and gender:
+        condition = and_(models.DonorInfo.name_norm == keys['name_norm'], models.DonorInfo.gender == gender)
+        # 年龄在limit之前过滤，同名的数据较多时不会漏掉较早登记的
+        age_clause = dedup.ages_close_clause(models.DonorInfo.age, age)
+        checks.append(('name', condition if age_clause is None else and_(condition, age_clause)))
+    candidates = {}
+    for reason, condition in checks:
+        stmt = select(*DONOR_COLUMNS).where(condition).order_by(models.DonorInfo.id.desc()).limit(limit)
+        if exclude_id is not None:
+            stmt = stmt.where(models.DonorInfo.id != exclude_id)
+        for row in rows_to_dicts(db.execute(stmt)):
+            if reason == 'name' and not dedup.ages_close(row['age'], age):
+                continue
+            candidates.setdefault(row['id'], {**row, 'matched': []})['matched'].append(reason)
+    return list(candidates.values())[:limit]
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def clear_principal_cache():
+    """清空本进程的已认证用户缓存，下次请求重新读取用户数据版本"""
+    principal_cache.clear()
+    shared_versions.pop('user')
+
+
 def create_user(db: Session, user_name, password, authority):
     try:
         db_user = models.User(user_name=user_name, password_hash=get_password_hash(password), authority=authority)
         db.add(db_user)
+        bump_data_version(db, 'user')
         db.commit()
         db.refresh(db_user)
     except IntegrityError:
         return "用户名不可重复"
     except SQLAlchemyError:
         return "数据错误"
+    clear_principal_cache()
     return '创建完成'
 
 
@@ -54,52 +360,269 @@ def authenticate_user(db: Session, user_name, password):
     return user
 
 
-def get_donorInfo_all(db: Session):
-    return db.query(models.DonorInfo).all()
+def rows_to_dicts(result):
+    """把查询结果转换为字典列表，用于直接序列化，避免构造ORM对象"""
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def get_donorInfo_all(db: Session, model=models.DonorInfo):
+    return rows_to_dicts(db.execute(select(*donor_columns(model))))
+
+
+def encode_cursor(last_id: int, order: str):
+    """把上一页最后一条的id编码为不透明游标"""
+    raw = json.dumps({"id": last_id, "order": order}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str):
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(data["id"]), data["order"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("无效的游标")
+
+
+def get_donorInfo_page(db: Session, cursor: str | None = None, limit: int = 50, order: str = "desc"):
+    """
+    按id做键集分页，每页只扫描limit+1条，翻页深度不影响耗时
+    :return: (本页数据, 下一页游标)，没有下一页时游标为None
+    """
+    stmt = select(*DONOR_COLUMNS)
+    if cursor is not None:
+        last_id, cursor_order = decode_cursor(cursor)
+        if cursor_order != order:
+            raise ValueError("游标与排序方向不一致")
+        if order == "desc":
+            stmt = stmt.where(models.DonorInfo.id < last_id)
+        else:
+            stmt = stmt.where(models.DonorInfo.id > last_id)
+    if order == "desc":
+        stmt = stmt.order_by(models.DonorInfo.id.desc())
+    else:
+        stmt = stmt.order_by(models.DonorInfo.id.asc())
+    res = rows_to_dicts(db.execute(stmt.limit(limit + 1)))
+    next_cursor = None
+    if len(res) > limit:
+        res = res[:limit]
+        next_cursor = encode_cursor(res[-1]["id"], order)
+    return res, next_cursor
+
+
+def encode_watermark(update_time: datetime.datetime, last_id: int):
+    """把最后一条数据的(修改时间, id)编码为增量同步的水位"""
+    raw = json.dumps({"t": update_time.isoformat(), "id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_watermark(watermark: str):
+    """解析水位，格式错误时抛出ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(watermark.encode()))
+        return datetime.datetime.fromisoformat(data["t"]), int(data["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("无效的水位")
+
+
+def get_donorInfo_changes(db: Session, since: str | None = None, limit: int = 500, settle_seconds: float = 2):
+    """
+    返回水位之后新增或修改的数据，按(修改时间, id)排序，使用ix_DonorInfo_update_time_id
+    最近settle_seconds秒内的修改可能属于尚未提交的事务，留到下次返回，避免水位越过它们
+    :return: (数据, 新水位, 是否还有更多)，没有新数据时水位不变
+    """
+    donor = models.DonorInfo
+    upper = datetime.datetime.now() - datetime.timedelta(seconds=settle_seconds)
+    stmt = select(*DONOR_COLUMNS).where(donor.update_time <= upper)
+    if since is not None:
+        last_time, last_id = decode_watermark(since)
+        stmt = stmt.where(or_(donor.update_time > last_time,
+                              and_(donor.update_time == last_time, donor.id > last_id)))
+    res = rows_to_dicts(db.execute(stmt.order_by(donor.update_time, donor.id).limit(limit + 1)))
+    has_more = len(res) > limit
+    res = res[:limit]
+    watermark = encode_watermark(res[-1]["update_time"], res[-1]["id"]) if res else since
+    return res, watermark, has_more
 
 
 def get_donorInfo_by_keyword(db: Session, keyword: str, con: str):
     filters = {keyword: con}
-    return db.query(models.DonorInfo).filter_by(**filters).scalar()
+    return db.query(models.DonorInfo).filter_by(**filters).first()
+
+
+def choose_attr(attr_name: str, model=models.DonorInfo):
+    """根据传入字符串返回DonorInfo类中的属性，未知字段抛出KeyError"""
+    if attr_name not in DONOR_FIELDS:
+        raise KeyError(attr_name)
+    return getattr(model, attr_name)
+
+
+def fuzzy_filter(attr_name: str, con: str, model=models.DonorInfo):
+    """模糊查询条件"""
+    return choose_attr(attr_name, model).ilike(f'%{con}%')
+
+
+def date_filter(start: datetime.date, end: datetime.date, model=models.DonorInfo):
+    """时间段查询条件，包含起止两天，使用半开区间以便走date索引"""
+    return and_(model.date >= start, model.date < end + datetime.timedelta(days=1))
+
+
+@lru_cache
+def has_fts(bind):
+    """数据库中是否已建立全文索引"""
+    return bind.dialect.name == 'sqlite' and inspect(bind).has_table(models.DONOR_FTS_TABLE)
+
+
+def fts_match(attr_name: str | None, con: str):
+    """生成FTS5查询表达式，整体作为短语匹配，可限定列"""
+    phrase = '"' + con.replace('"', '""') + '"'
+    if attr_name is None:
+        return phrase
+    return f'{attr_name} : {phrase}'
+
+
+def fuzzy_query_donorInfo(db: Session, attr_name: str | None, con: str, limit: int = 100, model=models.DonorInfo):
+    """
+    模糊查询，attr_name为None时在全部索引列中查找
+    有全文索引时按相关度排序，trigram分词至少需要3个字符，更短的条件或其他列使用普通匹配
+    归档表没有全文索引，总是使用普通匹配
+    """
+    if model is models.DonorInfo and (attr_name is None or attr_name in models.DONOR_FTS_COLUMNS):
+        if len(con) >= 3 and has_fts(db.get_bind()):
+            fts = table(models.DONOR_FTS_TABLE, column('rowid'), column('rank'))
+            stmt = select(*DONOR_COLUMNS).join(fts, fts.c.rowid == models.DonorInfo.id) \
+                .where(text(f'{models.DONOR_FTS_TABLE} MATCH :match').bindparams(match=fts_match(attr_name, con))) \
+                .order_by(fts.c.rank).limit(limit)
+            return rows_to_dicts(db.execute(stmt))
+    if attr_name is None:
+        condition = or_(*(fuzzy_filter(name, con, model) for name in models.DONOR_FTS_COLUMNS))
+    else:
+        condition = fuzzy_filter(attr_name, con, model)
+    stmt = select(*donor_columns(model)).where(condition).order_by(model.id.desc()).limit(limit)
+    return rows_to_dicts(db.execute(stmt))
+
+
+def coerce_value(attr, value):
+    """把查询参数转换为列对应的类型"""
+    if value is None:
+        return None
+    column_type = attr.type
+    if isinstance(column_type, DateTime):
+        return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(str(value))
+    if isinstance(column_type, Date):
+        return schemas.parse_date(value)
+    if isinstance(column_type, Boolean):
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes')
+        return bool(value)
+    if isinstance(column_type, Integer):
+        return int(value)
+    return str(value)
+
+
+def predicate_filter(db: Session, predicate: schemas.SearchPredicate, model=models.DonorInfo):
+    """
+    把单个查询条件编译为SQL条件，尽量使用可走索引的形式
+    """
+    try:
+        attr = choose_attr(predicate.field, model)
+    except KeyError:
+        raise ValueError(f'未知字段{predicate.field}')
+    if predicate.op == 'eq':
+        value = coerce_value(attr, predicate.value)
+        return attr.is_(None) if value is None else attr == value
+    if predicate.op == 'range':
+        start, end = coerce_value(attr, predicate.start), coerce_value(attr, predicate.end)
+        conditions = []
+        if start is not None:
+            conditions.append(attr >= start)
+        if end is not None:
+            if isinstance(attr.type, Date):
+                conditions.append(attr < end + datetime.timedelta(days=1))
+            else:
+                conditions.append(attr <= end)
+        if not conditions:
+            raise ValueError(f'{predicate.field}的范围条件缺少start或end')
+        return and_(*conditions)
+    value = '' if predicate.value is None else str(predicate.value)
+    if not value:
+        raise ValueError(f'{predicate.field}的{predicate.op}条件缺少value')
+    if predicate.op == 'prefix':
+        # 转换为范围比较，可以使用普通索引
+        upper = value[:-1] + chr(ord(value[-1]) + 1)
+        return and_(attr >= value, attr < upper)
+    if model is models.DonorInfo and predicate.field in models.DONOR_FTS_COLUMNS and len(value) >= 3 \
+            and has_fts(db.get_bind()):
+        fts = table(models.DONOR_FTS_TABLE, column('rowid'))
+        return models.DonorInfo.id.in_(
+            select(fts.c.rowid).where(text(f'{models.DONOR_FTS_TABLE} MATCH :match')
+                                      .bindparams(match=fts_match(predicate.field, value))))
+    return fuzzy_filter(predicate.field, value, model)
+
+
+def search_sort_keys(sort):
+    """排序字段列表，不含id时以id降序作为最后的排序依据，保证结果稳定"""
+    if any(name.lstrip('-') == 'id' for name in sort):
+        return list(sort)
+    return list(sort) + ['-id']
+
+
+def sort_rows(rows: list, sort):
+    """
+    在内存中按search的排序字段排序，用于合并多个来源的结果，空值的位置与SQLite一致(升序时在前)
+    """
+    for name in reversed(search_sort_keys(sort)):
+        field = name.lstrip('-')
+        rows.sort(key=lambda row: (row[field] is not None, row[field]), reverse=name.startswith('-'))
+    return rows
 
 
-def choose_attr(attr_name: str):
-    """根据传入字符串返回DonorInfo类中的属性"""
-    attr_dict = {
-        'name': models.DonorInfo.name,
-        'age': models.DonorInfo.age,
-        'gender': models.DonorInfo.gender,
-        'id_num': models.DonorInfo.id_num,
-        'sample_type': models.DonorInfo.sample_type,
-        'sample_quantity': models.DonorInfo.sample_quantity,
-        'date': models.DonorInfo.date,
-        'place': models.DonorInfo.place,
-        'phone': models.DonorInfo.phone,
-        'serial': models.DonorInfo.serial,
-        'available': models.DonorInfo.available,
-        'create_time': models.DonorInfo.create_time,
-        'update_time': models.DonorInfo.update_time
-    }
-    return attr_dict[attr_name]
+def search_donorInfo(db: Session, query: schemas.SearchQuery, count_limit: int = 10000, model=models.DonorInfo):
+    """
+    组合多个条件查询，返回(本页数据, 总数, 总数是否为估计值)
+    总数最多统计count_limit条，超过时只返回上限
+    """
+    conditions = [predicate_filter(db, p, model) for p in query.predicates]
+    order_by = []
+    for name in search_sort_keys(query.sort):
+        try:
+            attr = choose_attr(name.lstrip('-'), model)
+        except KeyError:
+            raise ValueError(f'未知排序字段{name}')
+        order_by.append(attr.desc() if name.startswith('-') else attr.asc())
+    stmt = select(*donor_columns(model)).where(*conditions).order_by(*order_by).limit(query.limit)
+    items = rows_to_dicts(db.execute(stmt))
+    if len(items) < query.limit:
+        return items, len(items), False
+    capped = select(model.id).where(*conditions).limit(count_limit).subquery()
+    total = db.execute(select(func.count()).select_from(capped)).scalar()
+    return items, total, total >= count_limit
 
 
-def fuzzy_query_donorInfo(db: Session, attr_name: str, con: str):
-    return db.query(models.DonorInfo).filter(choose_attr(attr_name).ilike(f'%{con}%')).all()
+def query_date(db: Session, start: datetime.date, end: datetime.date, model=models.DonorInfo):
+    stmt = select(*donor_columns(model)).where(date_filter(start, end, model)).order_by(model.date.desc())
+    return rows_to_dicts(db.execute(stmt))
 
 
-def query_date(db: Session, start: str, end: str):
-    starttime = start + ' ' + '0:0:0'
-    endtime = end + ' ' + '23:59:59'
-    return db.query(models.DonorInfo).filter(models.DonorInfo.date >= starttime) \
-        .filter(models.DonorInfo.date <= endtime).order_by(models.DonorInfo.date.desc()).all()
+def iter_donorInfo(db: Session, start: datetime.date | None = None, end: datetime.date | None = None,
+                   attr_name: str | None = None, con: str | None = None, chunk_size: int = 1000):
+    """
+    按条件逐块读取数据，用于导出，内存占用与总条数无关
+    :return: 按id升序的行元组迭代器，列顺序同DONOR_COLUMNS
+    """
+    stmt = select(*DONOR_COLUMNS)
+    if start is not None and end is not None:
+        stmt = stmt.where(date_filter(start, end))
+    if attr_name is not None and con is not None:
+        stmt = stmt.where(fuzzy_filter(attr_name, con))
+    stmt = stmt.order_by(models.DonorInfo.id).execution_options(yield_per=chunk_size)
+    for partition in db.execute(stmt).partitions():
+        yield from partition
 
 
-def query_today_num(db: Session, today: str):
-    res = db.query(models.DonorInfo).filter(models.DonorInfo.date == today).all()
-    num = 0
-    for i in res:
-        num += 1
-    return num
+def query_today_num(db: Session, today: datetime.date):
+    return db.query(func.count(models.DonorInfo.id)).filter(models.DonorInfo.date == today).scalar()
 
 
 def get_all_user(db: Session):
@@ -108,5 +631,8 @@ def get_all_user(db: Session):
 
 def change_user_authority(db: Session, user_id: int, authority: int):
     user = db.query(models.User).filter(models.User.id == user_id).update({'authority': authority})
+    # 权限修改需立即生效，版本加一后其他worker中已认证用户的缓存也不再命中
+    bump_data_version(db, 'user')
     db.commit()
+    clear_principal_cache()
     return user
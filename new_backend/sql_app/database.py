@@ -1,12 +1,152 @@
-from sqlalchemy import create_engine
+import itertools
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from .cache import LRUCache
+from .config import settings
+
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+# 同步数据库对应的异步驱动
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+asyncmy", "postgresql": "postgresql+asyncpg"}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新建的SQLite连接按配置设置PRAGMA"""
+    journal_mode = settings.sqlite_journal_mode.upper()
+    synchronous = settings.sqlite_synchronous.upper()
+    if journal_mode not in SQLITE_JOURNAL_MODES or synchronous not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f'无效的SQLite配置: journal_mode={journal_mode}, synchronous={synchronous}')
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.close()
+
+
+def engine_options(url: str):
+    """create_engine的参数，同步和异步引擎共用"""
+    kwargs = {"echo": settings.echo, "pool_pre_ping": settings.pool_pre_ping}
+    db_url = make_url(url)
+    if db_url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if db_url.get_backend_name() == "sqlite" and db_url.database in (None, "", ":memory:"):
+        # 内存数据库所有线程共用一个连接，否则每个线程看到的是不同的数据库
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(pool_size=settings.pool_size, max_overflow=settings.max_overflow,
+                      pool_recycle=settings.pool_recycle)
+    return kwargs
+
+
+def create_db_engine(url: str):
+    """
+    按配置创建数据库引擎，SQLite连接会自动设置PRAGMA
+    """
+    new_engine = create_engine(url, **engine_options(url))
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", set_sqlite_pragmas)
+    return new_engine
+
+
+def to_async_url(url: str):
+    """把同步数据库地址转换为对应异步驱动的地址"""
+    db_url = make_url(url)
+    if db_url.get_dialect().is_async:
+        return url
+    return db_url.set(drivername=ASYNC_DRIVERS[db_url.get_backend_name()]).render_as_string(hide_password=False)
+
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+def create_async_db_engine(url: str):
+    """
+    创建异步引擎，PRAGMA和连接池配置与同步引擎相同
+    内存数据库在异步引擎中是另一个独立的数据库，只能使用文件数据库
+    """
+    kwargs = engine_options(url)
+    if "pool_size" in kwargs:
+        # aiosqlite默认不使用连接池，每次查询都要重新连接和设置PRAGMA
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+    new_engine = create_async_engine(url, **kwargs)
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return new_engine
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 归档表可以放在单独的数据库文件中
+archive_engine = create_db_engine(settings.archive_database_url) if settings.archive_database_url else engine
+ArchiveSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+
+# 只读接口使用的异步引擎，未开启时为None，服务停止时需调用dispose关闭连接
+async_engine = None
+async_archive_engine = None
+AsyncSessionLocal = None
+AsyncArchiveSessionLocal = None
+if settings.async_enabled:
+    async_engine = create_async_db_engine(settings.async_database_url or to_async_url(SQLALCHEMY_DATABASE_URL))
+    async_archive_engine = async_engine
+    if settings.archive_database_url:
+        async_archive_engine = create_async_db_engine(to_async_url(settings.archive_database_url))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncArchiveSessionLocal = async_sessionmaker(async_archive_engine, autoflush=False, expire_on_commit=False)
+
+
+def split_urls(value: str):
+    """逗号分隔的数据库地址"""
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+class ReplicaRouter:
+    """
+    只读会话的路由: 轮流使用从库，用户写入后sticky_seconds秒内其读请求仍走主库，能读到自己刚写入的数据
+    写入记录保存在进程内，多个worker时需由负载均衡把同一用户的请求分到同一worker
+    """
+
+    def __init__(self, primary, replicas: list, sticky_seconds: float, max_users: int = 10000):
+        self.primary = primary
+        self.replicas = replicas
+        self._next = itertools.cycle(replicas)
+        self._lock = threading.Lock()
+        self._recent_writers = LRUCache(maxsize=max_users, ttl=sticky_seconds)
+
+    def mark_write(self, user_name: str):
+        if self.replicas:
+            self._recent_writers.set(user_name, True)
+
+    def choose(self, user_name: str | None = None):
+        """
+        :return: (会话工厂, 是否为从库)
+        """
+        if not self.replicas or (user_name is not None and self._recent_writers.get(user_name)):
+            return self.primary, False
+        with self._lock:
+            return next(self._next), True
+
+
+# 从库只用于只读接口，表结构由主库复制，不在从库上执行迁移
+replica_engines = []
+replica_sessions = []
+for replica_url in split_urls(settings.replica_database_urls):
+    if settings.async_enabled:
+        replica_engine = create_async_db_engine(to_async_url(replica_url))
+        replica_sessions.append(async_sessionmaker(replica_engine, autoflush=False, expire_on_commit=False))
+    else:
+        replica_engine = create_db_engine(replica_url)
+        replica_sessions.append(sessionmaker(autocommit=False, autoflush=False, bind=replica_engine))
+    replica_engines.append(replica_engine)
+read_router = ReplicaRouter(AsyncSessionLocal or SessionLocal, replica_sessions, settings.read_your_writes_seconds)
+
 Base = declarative_base()
+ArchiveBase = declarative_base()
@@ -0,0 +1,207 @@
+"""
+疑似重复献血者检测
+
+同一献血者可能在不同采样点重复登记，按规范化后的身份证号码、联系电话匹配，
+姓名相同时再比较性别和年龄。新增数据时按索引查找候选，全表检查按规范化字段分块，
+只比较同一块内的数据，不做两两比较:
+
+    python -m sql_app.dedup --out duplicates.csv
+"""
+import csv
+import re
+import unicodedata
+from itertools import groupby
+
+from sqlalchemy import Integer, String, cast, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+ID_WEIGHTS = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
+ID_CHECK_CODES = "10X98765432"
+# 年龄相差不超过该值视为同一人(登记时间不同)
+AGE_TOLERANCE = 1
+
+
+def normalize_id_num(value):
+    """身份证号码: 全角转半角、去除空格和连字符、x大写，15位旧号码转换为18位"""
+    if not value:
+        return None
+    value = re.sub(r'[\s-]', '', unicodedata.normalize('NFKC', str(value))).upper()
+    if len(value) == 15 and value.isdigit():
+        body = value[:6] + '19' + value[6:]
+        value = body + ID_CHECK_CODES[sum(int(c) * w for c, w in zip(body, ID_WEIGHTS)) % 11]
+    return value or None
+
+
+def normalize_phone(value):
+    """联系电话: 只保留数字，去掉+86/0086前缀"""
+    if not value:
+        return None
+    digits = re.sub(r'\D', '', unicodedata.normalize('NFKC', str(value)))
+    for prefix in ('0086', '86'):
+        if digits.startswith(prefix) and len(digits) - len(prefix) == 11:
+            digits = digits[len(prefix):]
+    return digits or None
+
+
+def normalize_name(value):
+    """姓名: 全角转半角、去除空白、小写"""
+    if not value:
+        return None
+    return re.sub(r'\s', '', unicodedata.normalize('NFKC', str(value))).lower() or None
+
+
+def normalized_keys(id_num, phone, name):
+    """DonorInfo中用于查重的规范化字段"""
+    return {
+        'id_num_norm': normalize_id_num(id_num),
+        'phone_norm': normalize_phone(phone),
+        'name_norm': normalize_name(name),
+    }
+
+
+def parse_age(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def ages_close(a, b):
+    """年龄无法识别时不作为否定条件"""
+    a, b = parse_age(a), parse_age(b)
+    return a is None or b is None or abs(a - b) <= AGE_TOLERANCE
+
+
+def ages_close_clause(column, age):
+    """
+    ages_close的SQL条件，在数据库中先排除年龄相差较大的数据；返回None时不按年龄过滤
+    只有转为整数再转回文本不变的年龄(如'30')按数值比较，'030'、'未知'等都保留，再由ages_close判断
+    """
+    target = parse_age(age)
+    if target is None:
+        return None
+    age_text = func.trim(column)
+    age_num = cast(age_text, Integer)
+    return or_(column.is_(None), cast(age_num, String) != age_text,
+               age_num.between(target - AGE_TOLERANCE, target + AGE_TOLERANCE))
+
+
+class DisjointSet:
+    """并查集，只记录出现在重复块中的id"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            # 路径减半
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # 以较小的id为代表
+            self.parent[max(a, b)] = min(a, b)
+
+
+def iter_blocks(db: Session, key_columns, chunk_size: int):
+    """
+    按key_columns排序流式读取，相同键的数据为一块，只返回多于一条的块
+    """
+    table = models.DonorInfo
+    stmt = (select(table.id, table.age, *key_columns)
+            .where(*(c.is_not(None) for c in key_columns))
+            .order_by(*key_columns, table.id)
+            .execution_options(yield_per=chunk_size))
+    for _, rows in groupby(db.execute(stmt), key=lambda r: tuple(r[2:])):
+        rows = list(rows)
+        if len(rows) > 1:
+            yield rows
+
+
+def find_duplicate_clusters(db: Session, chunk_size: int = 10000):
+    """
+    把DonorInfo聚类为疑似重复的组
+    :return: [(id列表, 匹配依据集合)]，按最小id排序
+    """
+    table = models.DonorInfo
+    clusters = DisjointSet()
+    reasons = {}
+
+    def link(ids, reason):
+        for row_id in ids:
+            clusters.union(ids[0], row_id)
+            reasons.setdefault(row_id, set()).add(reason)
+
+    for rows in iter_blocks(db, [table.id_num_norm], chunk_size):
+        link([r.id for r in rows], 'id_num')
+    for rows in iter_blocks(db, [table.phone_norm], chunk_size):
+        link([r.id for r in rows], 'phone')
+    for rows in iter_blocks(db, [table.name_norm, table.gender], chunk_size):
+        # 同名同性别的块内按年龄排序，每组与组内最小的年龄比较，不逐个相邻传递，
+        # 否则常见姓名的各个年龄会连成一个大组
+        rows = sorted((parse_age(r.age), r.id) for r in rows if parse_age(r.age) is not None)
+        age_groups = []
+        for age, row_id in rows:
+            if not age_groups or age - age_groups[-1][0] > AGE_TOLERANCE:
+                age_groups.append((age, []))
+            age_groups[-1][1].append(row_id)
+        for _, ids in age_groups:
+            if len(ids) > 1:
+                link(ids, 'name')
+
+    groups = {}
+    for row_id in clusters.parent:
+        groups.setdefault(clusters.find(row_id), []).append(row_id)
+    result = []
+    for root in sorted(groups):
+        ids = sorted(groups[root])
+        result.append((ids, set().union(*(reasons[i] for i in ids))))
+    return result
+
+
+EXPORT_FIELDS = ['cluster', 'matched', 'id', 'name', 'gender', 'age', 'id_num', 'phone', 'place', 'date', 'serial']
+
+
+def write_clusters(db: Session, clusters, f, chunk_size: int = 1000):
+    """把聚类结果连同献血者信息写入CSV"""
+    table = models.DonorInfo
+    writer = csv.writer(f)
+    writer.writerow(EXPORT_FIELDS)
+    columns = [getattr(table, name) for name in EXPORT_FIELDS[2:]]
+    for start in range(0, len(clusters), chunk_size):
+        chunk = clusters[start:start + chunk_size]
+        ids = [i for cluster_ids, _ in chunk for i in cluster_ids]
+        rows = {r.id: r for r in db.execute(select(*columns).where(table.id.in_(ids)))}
+        for number, (cluster_ids, matched) in enumerate(chunk, start + 1):
+            for row_id in cluster_ids:
+                writer.writerow([number, '|'.join(sorted(matched)), *rows[row_id]])
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from loguru import logger
+
+    from .database import SessionLocal, engine
+    from .migrate import upgrade
+
+    parser = argparse.ArgumentParser(description='检测疑似重复的献血者')
+    parser.add_argument('--out', help='输出的CSV文件，默认输出到标准输出')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+    upgrade(engine)
+    with SessionLocal() as db:
+        found = find_duplicate_clusters(db, chunk_size=args.chunk_size)
+        if args.out:
+            with open(args.out, 'w', newline='', encoding='utf-8-sig') as out:
+                write_clusters(db, found, out)
+        else:
+            write_clusters(db, found, sys.stdout)
+    logger.info(f'共发现{len(found)}组疑似重复，涉及{sum(len(ids) for ids, _ in found)}条数据')
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from .crud import DONOR_COLUMNS
+
+EXPORT_FIELDS = [column.key for column in DONOR_COLUMNS]
+
+
+def _default(o):
+    """json无法直接处理的日期时间类型"""
+    if isinstance(o, datetime):
+        return o.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(o, date):
+        return o.strftime('%Y-%m-%d')
+    raise TypeError(f'{type(o)} 无法序列化')
+
+
+def iter_ndjson(rows, chunk_size: int = 1000):
+    """
+    把行迭代器编码为NDJSON，每chunk_size行输出一块
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, default=_default))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_csv(rows, chunk_size: int = 1000):
+    """
+    把行迭代器编码为CSV，首块带BOM和表头，方便Excel直接打开
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_FIELDS)
+    # 先输出表头，让客户端立即收到数据
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    count = 0
+    for row in rows:
+        writer.writerow(_default(v) if isinstance(v, (date, datetime)) else v for v in row)
+        count += 1
+        if count >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if count:
+        yield buffer.getvalue()
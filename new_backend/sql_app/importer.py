@@ -0,0 +1,81 @@
+import csv
+import datetime
+import io
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# 表头与字段名对应，同时支持英文字段名
+HEADER_ALIASES = {
+    "姓名": "name",
+    "年龄": "age",
+    "性别": "gender",
+    "身份证号码": "id_num",
+    "身份证号": "id_num",
+    "采样类型": "sample_type",
+    "样品类型": "sample_type",
+    "采样数量": "sample_quantity",
+    "采样时间": "date",
+    "采样日期": "date",
+    "采样地点": "place",
+    "联系电话": "phone",
+}
+
+
+def _clean(value):
+    """统一单元格的值，日期保留原类型，其余转为字符串"""
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _to_records(rows, first_row: int):
+    """
+    第一行为表头，返回(行号, 数据字典)列表，跳过空行
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return []
+    keys = [HEADER_ALIASES.get(str(h).strip(), str(h).strip()) if h is not None else None for h in header]
+    records = []
+    for line_no, row in enumerate(rows, start=first_row + 1):
+        values = [_clean(v) for v in row]
+        if not any(v is not None for v in values):
+            continue
+        records.append((line_no, {k: v for k, v in zip(keys, values) if k}))
+    return records
+
+
+def parse_donor_file(filename: str, content: bytes):
+    """
+    解析上传的CSV或XLSX文件
+    :return: (行号, 数据字典)列表，行号与表格中的行号一致
+    """
+    if filename.lower().endswith('.xlsx'):
+        if openpyxl is None:
+            raise ValueError('读取xlsx文件需要安装openpyxl')
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            return _to_records(workbook.active.iter_rows(values_only=True), first_row=1)
+        finally:
+            workbook.close()
+    if filename.lower().endswith('.csv'):
+        # 兼容Excel导出的带BOM的UTF-8和GBK编码
+        for encoding in ('utf-8-sig', 'gbk'):
+            try:
+                text = content.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError('无法识别CSV文件编码')
+        return _to_records(csv.reader(io.StringIO(text)), first_row=1)
+    raise ValueError('仅支持csv和xlsx文件')
@@ -0,0 +1,173 @@
+"""
+请求和SQL指标，以Prometheus文本格式输出
+
+MetricsMiddleware记录每个路由的延迟、响应大小和处理中的请求数，
+SQLAlchemy游标事件把每条SQL的次数和耗时累加到当前请求，便于发现N+1查询和慢接口。
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    """按标签分组的直方图"""
+
+    def __init__(self, name: str, description: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # 标签值 -> [各区间计数..., 总次数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(label_values)
+            if item is None:
+                item = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                item[index] += 1
+            item[-2] += 1
+            item[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        for label_values, item in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, item):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, ("le", bound))} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, ("le", "+Inf"))} '
+                         f'{item[-2]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {item[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {item[-2]}')
+        return lines
+
+
+class Gauge:
+    """可增减的数值"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge', f'{self.name} {self.value}']
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', '请求处理耗时', ('method', 'route', 'status'))
+RESPONSE_SIZE = Histogram('http_response_size_bytes', '响应体大小', ('method', 'route'), SIZE_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', '正在处理的请求数')
+REQUEST_QUERIES = Histogram('db_queries_per_request', '每个请求执行的SQL条数', ('method', 'route'),
+                            QUERY_COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram('db_time_per_request_seconds', '每个请求的SQL总耗时', ('method', 'route'))
+REGISTRY = [REQUEST_LATENCY, RESPONSE_SIZE, REQUESTS_IN_FLIGHT, REQUEST_QUERIES, REQUEST_SQL_TIME]
+
+
+class QueryStats:
+    """单个请求内的SQL统计"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+current_query_stats = contextvars.ContextVar('current_query_stats', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 开始时间放在本条语句的执行上下文中，语句出错时不会触发after_cursor_execute，也不会在连接上留下残留
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_start
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+
+def render_metrics():
+    """Prometheus文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    ASGI中间件，按路由模板(而不是实际路径)统计，未匹配的路径统一记为unmatched
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        response = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['size'] += len(message.get('body', b''))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            current_query_stats.reset(token)
+            route = scope.get('route')
+            route = getattr(route, 'path', 'unmatched')
+            method = scope['method']
+            REQUEST_LATENCY.observe(elapsed, method, route, str(response['status']))
+            RESPONSE_SIZE.observe(response['size'], method, route)
+            REQUEST_QUERIES.observe(stats.count, method, route)
+            REQUEST_SQL_TIME.observe(stats.seconds, method, route)
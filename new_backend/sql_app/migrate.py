@@ -0,0 +1,299 @@
+"""
+数据库结构升级
+
+create_all只会创建不存在的表，不会修改已存在的表，已有数据库在这里按版本号逐步升级。
+每个升级步骤都可以重复执行，服务启动时自动调用，也可以手动运行:
+
+    python -m sql_app.migrate
+
+多个worker同时启动时只有一个执行升级，其余等待后按新的版本号跳过已执行的步骤。
+"""
+import time
+from contextlib import contextmanager
+
+from loguru import logger
+from sqlalchemy import MetaData, bindparam, func, insert, inspect, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import Session
+
+from . import crud, dedup, models, schemas
+from .config import settings
+
+# (版本号, 说明, 升级函数)，按版本号递增
+MIGRATIONS = []
+# 升级锁的名称
+UPGRADE_LOCK_NAME = 'donor_schema_upgrade'
+UPGRADE_LOCK_KEY = 20230901
+
+
+def migration(version: int, description: str):
+    """注册升级步骤"""
+    def wrapper(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return wrapper
+
+
+def get_version(conn):
+    """当前数据库结构版本，未升级过的数据库为0"""
+    return conn.execute(select(func.max(models.SchemaVersion.version))).scalar() or 0
+
+
+@contextmanager
+def upgrade_lock(conn):
+    """
+    在升级期间持有命名锁，MySQL为GET_LOCK，PostgreSQL为advisory lock，都在连接断开时自动释放
+    SQLite没有命名锁，由begin_step在每一步开始时取得写锁
+    """
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        locked = conn.scalar(text('SELECT GET_LOCK(:name, :timeout)'),
+                             {'name': UPGRADE_LOCK_NAME, 'timeout': int(settings.migration_lock_timeout)})
+        if locked != 1:
+            raise RuntimeError(f'{settings.migration_lock_timeout}秒内未取得数据库升级锁')
+    elif dialect == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': UPGRADE_LOCK_KEY})
+    conn.commit()
+    try:
+        yield
+    finally:
+        conn.rollback()
+        if dialect == 'mysql':
+            conn.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': UPGRADE_LOCK_NAME})
+        elif dialect == 'postgresql':
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': UPGRADE_LOCK_KEY})
+        conn.commit()
+
+
+def begin_step(conn):
+    """
+    开始一步升级的事务，SQLite以BEGIN IMMEDIATE立即取得写锁，之后读到的版本号不会再被其他进程修改
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    deadline = time.monotonic() + settings.migration_lock_timeout
+    while True:
+        try:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            return
+        except OperationalError:
+            # busy_timeout内未取得写锁，其他worker的升级步骤尚未完成
+            conn.rollback()
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def create_tables(conn, metadata):
+    begin_step(conn)
+    metadata.create_all(bind=conn)
+    conn.commit()
+
+
+def upgrade(engine, archive_engine=None):
+    """
+    创建缺失的表，再依次执行高于当前版本的升级步骤，每一步单独提交
+    :param archive_engine: 归档数据库，默认与engine相同
+    """
+    with engine.connect() as conn, upgrade_lock(conn):
+        create_tables(conn, models.Base.metadata)
+        if archive_engine is None or archive_engine is engine:
+            create_tables(conn, models.ArchiveBase.metadata)
+        else:
+            with archive_engine.connect() as archive_conn:
+                create_tables(archive_conn, models.ArchiveBase.metadata)
+        for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+            begin_step(conn)
+            if version <= get_version(conn):
+                conn.rollback()
+                continue
+            logger.info(f'升级数据库到版本{version}: {description}')
+            func(conn)
+            conn.execute(models.SchemaVersion.__table__.insert().values(version=version))
+            conn.commit()
+
+
+def rename_duplicate_serials(conn):
+    """
+    旧版本按数量生成流水号，并发录入时会重复，无法创建唯一索引
+    重复的流水号保留id最小的一条，其余加上id作为后缀
+    """
+    table = models.DonorInfo.__table__
+    duplicates = select(table.c.serial).where(table.c.serial.is_not(None)) \
+        .group_by(table.c.serial).having(func.count() > 1)
+    rows = conn.execute(select(table.c.id, table.c.serial).where(table.c.serial.in_(duplicates))
+                        .order_by(table.c.serial, table.c.id)).all()
+    previous = None
+    for row_id, serial in rows:
+        if serial != previous:
+            previous = serial
+            continue
+        new_serial = f'{serial}_{row_id}'
+        suffix = 1
+        while conn.execute(select(table.c.id).where(table.c.serial == new_serial)).first() is not None:
+            suffix += 1
+            new_serial = f'{serial}_{row_id}_{suffix}'
+        logger.warning(f'DonorInfo id={row_id} 的流水号{serial}重复，改为{new_serial}')
+        conn.execute(update(table).where(table.c.id == row_id)
+                     .values(serial=new_serial, update_time=table.c.update_time))
+
+
+@migration(1, 'DonorInfo查询字段索引')
+def create_donor_indexes(conn):
+    table = models.DonorInfo.__table__
+    rename_duplicate_serials(conn)
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    for index in table.indexes:
+        # 后续版本新增的列由对应的升级步骤创建索引
+        if all(c.name in existing for c in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+@migration(2, 'DonorInfo模糊查询全文索引')
+def create_donor_fts(conn):
+    if conn.dialect.name != 'sqlite':
+        logger.warning('全文索引仅支持SQLite，模糊查询将使用普通匹配')
+        return
+    fts = models.DONOR_FTS_TABLE
+    cols = ', '.join(models.DONOR_FTS_COLUMNS)
+    new_cols = ', '.join(f'new.{c}' for c in models.DONOR_FTS_COLUMNS)
+    old_cols = ', '.join(f'old.{c}' for c in models.DONOR_FTS_COLUMNS)
+    try:
+        conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+                          f"content='DonorInfo', content_rowid='id', tokenize='trigram')"))
+    except Exception as e:
+        # trigram分词需要SQLite 3.34以上
+        logger.warning(f'无法创建全文索引，模糊查询将使用普通匹配: {e}')
+        return
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON DonorInfo BEGIN "
+                      f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON DonorInfo BEGIN "
+                      f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON DonorInfo BEGIN "
+                      f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+                      f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"))
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+@migration(3, 'DonorInfo.date统一为日期格式')
+def normalize_donor_dates(conn, batch_size=1000):
+    # 直接读取原始字符串，旧数据可能无法按Date类型解析
+    last_id = 0
+    while True:
+        rows = conn.execute(text('SELECT id, date FROM DonorInfo WHERE id > :last_id ORDER BY id LIMIT :n'),
+                            {'last_id': last_id, 'n': batch_size}).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changes = []
+        invalid = []
+        for row_id, value in rows:
+            if value is None:
+                continue
+            try:
+                normalized = schemas.parse_date(value).isoformat()
+            except ValueError:
+                # 原值保存到InvalidDonorDate后再置空，不在升级中丢失
+                logger.warning(f'DonorInfo id={row_id} 的日期无法识别，已置空，原值保存在InvalidDonorDate: {value}')
+                invalid.append({'donor_id': row_id, 'value': str(value)})
+                normalized = None
+            if normalized != str(value):
+                changes.append({'row_id': row_id, 'value': normalized})
+        if invalid:
+            conn.execute(insert(models.InvalidDonorDate.__table__), invalid)
+        if changes:
+            conn.execute(text('UPDATE DonorInfo SET date = :value WHERE id = :row_id'), changes)
+    # SQLite的Date以YYYY-MM-DD字符串保存，无需修改列类型
+    if conn.dialect.name == 'mysql':
+        conn.execute(text('ALTER TABLE DonorInfo MODIFY date DATE'))
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE "DonorInfo" ALTER COLUMN date TYPE DATE USING date::date'))
+
+
+@migration(4, 'DailyStats每日统计回填')
+def backfill_daily_stats(conn):
+    crud.rebuild_daily_stats(Session(bind=conn, join_transaction_mode='rollback_only'))
+
+
+@migration(5, 'DonorInfo查重用的规范化字段')
+def add_donor_norm_keys(conn, batch_size=1000):
+    table = models.DonorInfo.__table__
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    quoted = conn.dialect.identifier_preparer.quote(table.name)
+    for name in ('id_num_norm', 'phone_norm', 'name_norm'):
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE {quoted} ADD COLUMN {name} VARCHAR(255)'))
+    last_id = 0
+    while True:
+        rows = conn.execute(select(table.c.id, table.c.id_num, table.c.phone, table.c.name)
+                            .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        # 回填不算数据修改，保留原修改时间，否则所有数据都会出现在增量同步中
+        conn.execute(update(table).where(table.c.id == bindparam('row_id'))
+                     .values(update_time=table.c.update_time),
+                     [{'row_id': r.id, **dedup.normalized_keys(r.id_num, r.phone, r.name)} for r in rows])
+    for index in table.indexes:
+        if any(c.name in ('id_num_norm', 'phone_norm', 'name_norm') for c in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+@migration(6, 'DonorInfo修改时间索引')
+def create_update_time_index(conn):
+    table = models.DonorInfo.__table__
+    # 没有修改时间的旧数据不会出现在增量同步中，以创建时间补齐
+    conn.execute(update(table).where(table.c.update_time.is_(None))
+                 .values(update_time=func.coalesce(table.c.create_time, func.current_timestamp())))
+    for index in table.indexes:
+        if index.name == 'ix_DonorInfo_update_time_id':
+            index.create(conn, checkfirst=True)
+
+
+@migration(7, 'DonorInfo的id不再重用')
+def use_donor_autoincrement(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    table = models.DonorInfo.__table__
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                       {'name': table.name}).scalar()
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    # SQLite不能修改主键定义，按新结构建表后复制数据，原表的索引和全文索引触发器随原表删除后重新创建
+    new_table = table.to_metadata(MetaData(), name=f'{table.name}_new')
+    conn.execute(CreateTable(new_table))
+    columns = ', '.join(c.name for c in table.columns)
+    conn.execute(text(f'INSERT INTO "{new_table.name}" ({columns}) SELECT {columns} FROM "{table.name}"'))
+    conn.execute(text(f'DROP TABLE "{table.name}"'))
+    conn.execute(text(f'ALTER TABLE "{new_table.name}" RENAME TO "{table.name}"'))
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+    # 已归档数据的id同样不能再分配
+    last_ids = [conn.execute(select(func.max(table.c.id))).scalar() or 0]
+    if inspect(conn).has_table(models.DonorInfoArchive.__tablename__):
+        archive = models.DonorInfoArchive.__table__
+        last_ids.append(conn.execute(select(func.max(archive.c.id))).scalar() or 0)
+    conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': table.name})
+    conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                 {'name': table.name, 'seq': max(last_ids)})
+    if inspect(conn).has_table(models.DONOR_FTS_TABLE):
+        create_donor_fts(conn)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from .database import ArchiveSessionLocal, SessionLocal, archive_engine, engine
+
+    parser = argparse.ArgumentParser(description='数据库维护')
+    parser.add_argument('command', nargs='?', default='upgrade', choices=('upgrade', 'rebuild-stats'),
+                        help='upgrade: 升级数据库结构; rebuild-stats: 重新生成每日统计')
+    args = parser.parse_args()
+    upgrade(engine, archive_engine)
+    if args.command == 'rebuild-stats':
+        with SessionLocal() as db, ArchiveSessionLocal() as archive_db:
+            crud.rebuild_daily_stats(db, archive_db)
+        logger.info('每日统计已重新生成')
+    else:
+        logger.info('数据库已是最新版本')
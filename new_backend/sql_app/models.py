@@ -1,7 +1,8 @@
 import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, UniqueConstraint, DateTime
+import time
+from sqlalchemy import Boolean, Column, ForeignKey, Float, Index, Integer, String, UniqueConstraint, Date, DateTime
 
-from .database import Base
+from .database import ArchiveBase, Base
 
 
 class DonorInfo(Base):
@@ -9,20 +10,128 @@ class DonorInfo(Base):
         数据模板
     """
     __tablename__ = "DonorInfo"
+    __table_args__ = (
+        # 时间段查询及按日期、样品类型统计
+        Index('ix_DonorInfo_date_sample_type', 'date', 'sample_type'),
+        # 按修改时间增量同步
+        Index('ix_DonorInfo_update_time_id', 'update_time', 'id'),
+        # SQLite默认会重用被删除的最大id，归档后新数据的id会与归档表中的重复
+        {'sqlite_autoincrement': True},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String)
+    name = Column(String, index=True)
     age = Column(String)
     gender = Column(String)
-    id_num = Column(String)
+    id_num = Column(String, index=True)
     sample_type = Column(String)
     sample_quantity = Column(String)
-    date = Column(String)
+    date = Column(Date)
     place = Column(String)
-    phone = Column(String)
-    serial = Column(String)
+    phone = Column(String, index=True)
+    serial = Column(String, index=True, unique=True)
     available = Column(Boolean)
     create_time = Column(DateTime, default=datetime.datetime.now)
     update_time = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    # 查重用的规范化字段，见dedup.normalized_keys
+    id_num_norm = Column(String, index=True)
+    phone_norm = Column(String, index=True)
+    name_norm = Column(String, index=True)
+
+
+class DonorInfoArchive(ArchiveBase):
+    """
+    归档的DonorInfo，列与DonorInfo一致，id保持不变
+    """
+    __tablename__ = "DonorInfoArchive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, index=True)
+    age = Column(String)
+    gender = Column(String)
+    id_num = Column(String, index=True)
+    sample_type = Column(String)
+    sample_quantity = Column(String)
+    date = Column(Date, index=True)
+    place = Column(String)
+    phone = Column(String, index=True)
+    serial = Column(String, index=True)
+    available = Column(Boolean)
+    create_time = Column(DateTime)
+    update_time = Column(DateTime)
+    id_num_norm = Column(String, index=True)
+    phone_norm = Column(String, index=True)
+    name_norm = Column(String)
+    archived_at = Column(DateTime, default=datetime.datetime.now)
+
+
+# 模糊查询用的全文索引(SQLite FTS5 trigram)，由migrate创建，通过触发器与DonorInfo保持同步
+DONOR_FTS_TABLE = 'DonorInfo_fts'
+DONOR_FTS_COLUMNS = ['name', 'phone', 'id_num', 'place', 'serial']
+
+
+class InvalidDonorDate(Base):
+    """
+    升级时无法识别为日期的DonorInfo.date原值，DonorInfo中已置空，修正后可按donor_id写回
+    """
+    __tablename__ = 'InvalidDonorDate'
+    donor_id = Column(Integer, primary_key=True, autoincrement=False)
+    value = Column(String, nullable=False)
+    create_time = Column(DateTime, default=datetime.datetime.now)
+
+
+class SerialCounter(Base):
+    """
+    每日流水号计数器，按(日期, 样品代码)分别计数
+    """
+    __tablename__ = 'SerialCounter'
+    day = Column(String, primary_key=True)
+    sample_code = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+class DailyStats(Base):
+    """
+    每日统计，按(采样日期, 样品类型, 采样地点, 是否可用)计数，与DonorInfo在同一事务中更新
+    """
+    __tablename__ = 'DailyStats'
+    day = Column(Date, primary_key=True)
+    sample_type = Column(String, primary_key=True)
+    place = Column(String, primary_key=True)
+    available = Column(Boolean, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class LegacyImport(Base):
+    """
+    从Flask后端(旧表结构)导入数据的进度，每批数据与进度在同一事务中提交，见legacy_import
+    """
+    __tablename__ = 'LegacyImport'
+    source = Column(String, primary_key=True)
+    # 已导入的源数据的最大id
+    last_id = Column(Integer, nullable=False, default=0)
+    rows = Column(Integer, nullable=False, default=0)
+    # 流水号与已有数据重复、加了后缀的条数
+    renamed = Column(Integer, nullable=False, default=0)
+    update_time = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+
+class DataVersion(Base):
+    """
+    数据版本，提交修改时在同一事务中加一，多个worker和命令行工具共享，各进程据此使自己的缓存失效
+    name为donor时对应DonorInfo，为user时对应用户及权限
+    """
+    __tablename__ = 'DataVersion'
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+    # 最近一次修改的时间戳(秒)
+    changed_at = Column(Float, nullable=False, default=time.time)
+
+
+class SchemaVersion(Base):
+    """
+    数据库结构版本，由migrate.upgrade维护
+    """
+    __tablename__ = 'SchemaVersion'
+    version = Column(Integer, primary_key=True)
 
 
 class User(Base):
@@ -1,5 +1,24 @@
-from pydantic import BaseModel
-from typing import Union, List
+import datetime
+import re
+
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, List, Literal, Union
+
+
+def parse_date(value):
+    """
+    把'2023-9-1'、'2023/09/01'、'20230901'、'2023-09-01 10:00:00'等格式统一转换为date
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, str):
+        m = re.match(r'\s*(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})', value) or \
+            re.match(r'\s*(\d{4})(\d{2})(\d{2})\s*$', value)
+        if m:
+            return datetime.date(*map(int, m.groups()))
+    raise ValueError(f'无法识别的日期: {value}')
 
 
 class DonorInfoBase(BaseModel):
@@ -10,10 +29,89 @@ class DonorInfoBase(BaseModel):
     id_num: str
     sample_type: str
     sample_quantity: str
-    date: str
+    date: datetime.date
     place: str
     phone: str
 
+    _parse_date = field_validator('date', mode='before')(parse_date)
+
+
+class DonorInfoOut(BaseModel):
+    """列表接口返回的数据"""
+    id: int
+    name: str | None = None
+    age: str | None = None
+    gender: str | None = None
+    id_num: str | None = None
+    sample_type: str | None = None
+    sample_quantity: str | None = None
+    date: datetime.date | None = None
+    place: str | None = None
+    phone: str | None = None
+    serial: str | None = None
+    available: bool | None = None
+    create_time: datetime.datetime | None = None
+    update_time: datetime.datetime | None = None
+
+
+class DonorChanges(BaseModel):
+    items: List[DonorInfoOut]
+    # 下次请求时作为since传入
+    watermark: str | None = None
+    has_more: bool
+
+
+class DuplicateCheckBase(BaseModel):
+    """查重条件，至少提供身份证号码、联系电话或姓名+性别之一"""
+    name: str | None = None
+    gender: str | None = None
+    age: str | None = None
+    id_num: str | None = None
+    phone: str | None = None
+    exclude_id: int | None = None
+
+
+class DuplicateCandidate(DonorInfoOut):
+    # 匹配依据: id_num, phone, name
+    matched: List[str]
+
+
+class DonorInfoPage(BaseModel):
+    items: List[DonorInfoOut]
+    next_cursor: str | None = None
+
+
+class SearchPredicate(BaseModel):
+    """
+    单个查询条件: eq等于, prefix前缀, contains包含, range范围(start和end均包含在内，可只给一端)
+    """
+    field: str
+    op: Literal["eq", "prefix", "contains", "range"]
+    value: Any = None
+    start: Any = None
+    end: Any = None
+
+
+class SearchQuery(BaseModel):
+    predicates: List[SearchPredicate] = []
+    # 排序字段，前缀-表示降序
+    sort: List[str] = ["-id"]
+    limit: int = Field(default=50, ge=1, le=1000)
+    # 是否同时查询归档的数据
+    include_archive: bool = False
+
+
+class SearchResult(BaseModel):
+    items: List[DonorInfoOut]
+    # 总数超过上限时为估计值(即上限)
+    total: int
+    total_is_estimate: bool
+
+
+class DonorAvailableBase(BaseModel):
+    id: int
+    available: bool
+
 
 class UserBase(BaseModel):
     id: int | None = None
@@ -31,10 +129,16 @@ class TokenData(BaseModel):
 
 
 class QueryDateBase(BaseModel):
-    start_time: str
-    end_time: str
+    start_time: datetime.date
+    end_time: datetime.date
+    include_archive: bool = False
+
+    _parse_date = field_validator('start_time', 'end_time', mode='before')(parse_date)
 
 
 class FuzzyKeywordBase(BaseModel):
-    keyword: str
+    # 为空时在姓名、电话、身份证号、地点、流水号中查找
+    keyword: str | None = None
     con: str
+    limit: int = Field(default=100, ge=1, le=1000)
+    include_archive: bool = False
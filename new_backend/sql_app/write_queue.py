@@ -0,0 +1,113 @@
+"""
+新增数据的合并写入队列
+
+SQLite每次提交都要获取写锁并同步磁盘，多个采样点同时录入时逐条提交会互相等待。
+开启后/add把数据放入队列，由单独的写线程每攒够max_batch条或等待max_wait秒合并为一个事务写入，
+每个请求仍然得到自己的id和流水号。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from loguru import logger
+from sqlalchemy import select
+
+from . import crud, models, schemas
+
+_STOP = object()
+
+
+class WriteQueue:
+    """单写线程的合并提交队列，写线程在第一次提交时启动"""
+
+    def __init__(self, session_factory, max_batch: int = 100, max_wait: float = 0.01):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, info: schemas.DonorInfoBase, sample_code: str) -> Future:
+        """
+        加入队列，返回的Future在提交后得到新增数据的字典
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._queue.put((info, sample_code, future))
+        return future
+
+    def stop(self, timeout: float = 10):
+        """写完队列中已有的数据后停止写线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        """
+        一个事务写入整批数据，失败时逐条重新写入，只有写入失败的数据的请求得到异常
+        """
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            rows = self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception(e)
+                batch[0][2].set_exception(e)
+                return
+            logger.warning(f'{len(batch)}条数据合并写入失败，逐条重新写入: {e}')
+            for item in batch:
+                try:
+                    row = self._write([item])[0]
+                except Exception as item_error:
+                    logger.exception(item_error)
+                    item[2].set_exception(item_error)
+                else:
+                    item[2].set_result(row)
+            return
+        for (_, _, future), row in zip(batch, rows):
+            future.set_result(row)
+
+    def _write(self, batch):
+        """在一个事务中写入，返回与batch顺序一致的新增数据字典"""
+        serial_day = datetime.today().strftime("%Y%m%d")
+        with self.session_factory() as db:
+            inserted = crud.add_donorInfo_bulk(db, [(info, code) for info, code, _ in batch], serial_day)
+            ids = [row_id for row_id, _ in inserted]
+            rows = {row['id']: row for row in crud.rows_to_dicts(
+                db.execute(select(*crud.DONOR_COLUMNS).where(models.DonorInfo.id.in_(ids))))}
+        return [rows[row_id] for row_id in ids]
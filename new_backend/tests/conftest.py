@@ -0,0 +1,75 @@
+"""
+测试使用临时目录中的SQLite数据库，每个测试前重新创建并升级到最新结构
+
+    cd new_backend && python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import types
+
+TEST_DIR = tempfile.mkdtemp(prefix='donor-test-')
+DB_PATH = os.path.join(TEST_DIR, 'test.db')
+# 需在导入sql_app之前设置，引擎在导入时按配置创建
+os.environ['DONOR_DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from sql_app import secret_key  # noqa: F401
+except ImportError:
+    # secret_key.py不在版本库中，测试使用固定的密钥
+    sys.modules['sql_app.secret_key'] = types.SimpleNamespace(secret_key='test-secret-key')
+
+import pytest
+
+from sql_app import crud, migrate, schemas
+from sql_app.database import SessionLocal, engine
+
+
+def reset_database():
+    """删除数据库文件后重新升级，得到与新部署相同的空数据库"""
+    engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    migrate.upgrade(engine)
+
+
+@pytest.fixture
+def db():
+    reset_database()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth(client, db):
+    """root用户(全部权限)的请求头"""
+    crud.create_user(db, 'root', 'password', 7)
+    response = client.post('/login', data={'username': 'root', 'password': 'password'})
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def donor(i=0, **fields):
+    """/add请求体"""
+    values = dict(name=f'张三{i}', age='30', gender='男', id_num=f'11010119900101{i:04d}', sample_type='骨髓',
+                  sample_quantity='1', date='2023-09-01', place='北京', phone=f'1380000{i:04d}')
+    values.update(fields)
+    return values
+
+
+def add_donors(db, *rows, day='20230901'):
+    """rows为donor()的参数字典，直接写入数据库，返回写入的id列表"""
+    infos = [(schemas.DonorInfoBase(**donor(**row)), 'BM') for row in rows]
+    return [row_id for row_id, _ in crud.add_donorInfo_bulk(db, infos, day)]
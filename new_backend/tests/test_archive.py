@@ -0,0 +1,80 @@
+"""
+冷热数据归档
+"""
+import datetime
+
+import pytest
+from conftest import add_donors, donor
+from sqlalchemy import func, insert, select, update
+
+from sql_app import archive, crud, models
+
+
+def count(db, model):
+    return db.scalar(select(func.count()).select_from(model))
+
+
+def stats(db):
+    db.expire_all()
+    stats = models.DailyStats
+    return sorted(db.execute(select(stats.day, stats.sample_type, stats.place, stats.available, stats.count)).all())
+
+
+def test_archive_old_and_unavailable(db):
+    old = add_donors(db, *(dict(i=i, date='2020-01-0' + str(i + 1)) for i in range(3)))
+    recent = add_donors(db, *(dict(i=i, date=datetime.date.today().isoformat()) for i in range(3, 6)))
+    crud.set_donorInfo_available(db, recent[0], False)
+    # 最近修改的不可用数据不归档
+    crud.set_donorInfo_available(db, recent[1], False)
+    db.execute(update(models.DonorInfo).where(models.DonorInfo.id == recent[0])
+               .values(update_time=datetime.datetime.now() - datetime.timedelta(days=60)))
+    db.commit()
+    before = stats(db)
+    assert archive.archive_donors(db, db, after_days=365, unavailable_after_days=30, batch_size=2) == 4
+    assert sorted(db.scalars(select(models.DonorInfo.id))) == recent[1:]
+    assert sorted(db.scalars(select(models.DonorInfoArchive.id))) == old + recent[:1]
+    # 每日统计仍包含归档的数据
+    assert stats(db) == before
+    crud.rebuild_daily_stats(db, db)
+    assert stats(db) == before
+
+
+def test_archived_ids_are_not_reused(client, auth, db):
+    ids = add_donors(db, dict(i=1, date='2020-01-01'))
+    archive.archive_donors(db, db, after_days=365, unavailable_after_days=0)
+    new_id = client.post('/add', json=donor(2), headers=auth).json()['id']
+    assert new_id > ids[0]
+
+
+def test_include_archive(client, auth, db):
+    old = add_donors(db, dict(i=1, date='2020-01-01'))
+    recent = add_donors(db, dict(i=2, date=datetime.date.today().isoformat()))
+    archive.archive_donors(db, db, after_days=365, unavailable_after_days=0)
+    assert [row['id'] for row in client.get('/query_all', headers=auth).json()] == recent
+    rows = client.get('/query_all', params={'include_archive': True}, headers=auth).json()
+    assert [row['id'] for row in rows] == old + recent
+    body = client.post('/query_datas', json={'start_time': '2019-12-01', 'end_time': '2020-02-01',
+                                             'include_archive': True}, headers=auth).json()
+    assert [row['id'] for row in body] == old
+
+
+def test_resume_after_partial_archive(db):
+    ids = add_donors(db, *(dict(i=i, date='2020-01-01') for i in range(2)))
+    # 上次归档写入了归档表，但未删除DonorInfo中的数据
+    row = db.execute(select(models.DonorInfo.__table__).where(models.DonorInfo.id == ids[0])).mappings().one()
+    db.execute(insert(models.DonorInfoArchive), [dict(row, archived_at=datetime.datetime.now())])
+    db.commit()
+    assert archive.archive_donors(db, db, after_days=365, unavailable_after_days=0) == 2
+    assert count(db, models.DonorInfo) == 0
+    assert count(db, models.DonorInfoArchive) == 2
+
+
+def test_conflicting_archive_id_stops(db):
+    ids = add_donors(db, dict(i=1, date='2020-01-01'))
+    db.execute(insert(models.DonorInfoArchive), [dict(id=ids[0], serial='其他数据',
+                                                      archived_at=datetime.datetime.now())])
+    db.commit()
+    with pytest.raises(RuntimeError):
+        archive.archive_donors(db, db, after_days=365, unavailable_after_days=0)
+    db.rollback()
+    assert count(db, models.DonorInfo) == 1
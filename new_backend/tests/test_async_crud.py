@@ -0,0 +1,66 @@
+"""
+只读查询的异步版本: AsyncSession和线程池中的Session得到相同的结果，都不阻塞事件循环
+"""
+import asyncio
+import datetime
+import time
+
+from conftest import DB_PATH, add_donors
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from sql_app import async_crud, schemas
+from sql_app.database import SessionLocal, create_async_db_engine, to_async_url
+
+
+def read_all(session_factory):
+    async def queries():
+        async def one(func, *args, **kwargs):
+            # 每个查询使用单独的会话，与接口中的用法相同
+            if isinstance(session_factory, async_sessionmaker):
+                async with session_factory() as db:
+                    return await func(db, *args, **kwargs)
+            with session_factory() as db:
+                return await func(db, *args, **kwargs)
+
+        return await asyncio.gather(
+            one(async_crud.get_donorInfo_all),
+            one(async_crud.get_donorInfo_page, limit=2),
+            one(async_crud.query_date, datetime.date(2023, 9, 1), datetime.date(2023, 9, 2)),
+            one(async_crud.fuzzy_query_donorInfo, 'name', '张三1'),
+            one(async_crud.search_donorInfo, schemas.SearchQuery(limit=2)),
+            one(async_crud.query_stats, datetime.date(2023, 9, 1), datetime.date(2023, 9, 2)),
+        )
+
+    return asyncio.run(queries())
+
+
+def test_async_session_matches_sync(db):
+    add_donors(db, *(dict(i=i, date=f'2023-09-0{i % 3 + 1}') for i in range(5)))
+    async_engine = create_async_db_engine(to_async_url(f'sqlite:///{DB_PATH}'))
+    try:
+        assert read_all(async_sessionmaker(async_engine, expire_on_commit=False)) == read_all(SessionLocal)
+    finally:
+        asyncio.run(async_engine.dispose())
+
+
+def test_run_does_not_block_loop(db):
+    def slow_query(session):
+        time.sleep(0.2)
+        return 'done'
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await async_crud.run(db, slow_query)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == 'done' and ticks >= 5
@@ -0,0 +1,54 @@
+"""
+写接口和get_current_user中的同步SQL不在事件循环所在的线程中执行
+"""
+import asyncio
+import functools
+
+import pytest
+from conftest import donor
+
+from sql_app import crud
+
+SYNC_FUNCS = ['get_user', 'get_data_version', 'allocate_serial', 'find_duplicate_candidates',
+              'set_donorInfo_available', 'add_donorInfo_bulk', 'get_all_user', 'change_user_authority']
+
+
+@pytest.fixture
+def loop_calls(monkeypatch):
+    """记录在事件循环中执行的crud函数"""
+    calls = []
+
+    def wrap(name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                calls.append(name)
+            except RuntimeError:
+                pass
+            return func(*args, **kwargs)
+        return wrapper
+
+    for name in SYNC_FUNCS:
+        monkeypatch.setattr(crud, name, wrap(name, getattr(crud, name)))
+    return calls
+
+
+def test_write_endpoints_do_not_block_loop(client, auth, loop_calls):
+    from sql_app.cache import principal_cache, shared_versions
+    principal_cache.clear()
+    shared_versions.clear()
+
+    response = client.post('/add', params={'check_duplicate': True}, json=donor(1), headers=auth)
+    assert response.status_code == 200
+    donor_id = response.json()['id']
+    assert client.post('/change_available', json={'id': donor_id, 'available': False}, headers=auth).status_code == 200
+    assert client.post('/add_batch', json=[donor(2)], headers=auth).json()['succeeded'] == 1
+    csv = ','.join(donor(3)) + '\n' + ','.join(donor(3).values()) + '\n'
+    response = client.post('/import', files={'file': ('donors.csv', csv.encode(), 'text/csv')}, headers=auth)
+    assert response.json()['succeeded'] == 1
+    assert len(client.get('/user/get_all', headers=auth).json()) == 1
+    assert client.post('/duplicate_check', json={'name': '张三1', 'gender': '男', 'age': '30'},
+                       headers=auth).status_code == 200
+
+    assert loop_calls == []
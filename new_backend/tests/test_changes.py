@@ -0,0 +1,59 @@
+"""
+增量同步(/changes)和列表接口的ETag
+"""
+import pytest
+from conftest import add_donors
+
+from sql_app.config import settings
+
+
+@pytest.fixture
+def settled(monkeypatch):
+    monkeypatch.setattr(settings, 'changes_settle_seconds', 0)
+
+
+def sync(client, auth, since=None, limit=2):
+    params = {'limit': limit, **({'since': since} if since else {})}
+    return client.get('/changes', params=params, headers=auth).json()
+
+
+def test_sync_in_batches(client, auth, db, settled):
+    ids = add_donors(db, *(dict(i=i) for i in range(3)))
+    first = sync(client, auth)
+    assert ([item['id'] for item in first['items']], first['has_more']) == (ids[:2], True)
+    second = sync(client, auth, first['watermark'])
+    assert ([item['id'] for item in second['items']], second['has_more']) == (ids[2:], False)
+    # 没有新数据时水位不变
+    third = sync(client, auth, second['watermark'])
+    assert (third['items'], third['watermark']) == ([], second['watermark'])
+    # 修改过的数据再次出现
+    client.post('/change_available', json={'id': ids[0], 'available': False}, headers=auth)
+    fourth = sync(client, auth, third['watermark'])
+    assert [(item['id'], item['available']) for item in fourth['items']] == [(ids[0], False)]
+
+
+def test_recent_changes_wait_to_settle(client, auth, db):
+    add_donors(db, dict(i=1))
+    body = sync(client, auth)
+    assert (body['items'], body['watermark']) == ([], None)
+
+
+def test_invalid_watermark(client, auth):
+    assert client.get('/changes', params={'since': 'bad'}, headers=auth).status_code == 400
+
+
+def test_etag(client, auth, db):
+    ids = add_donors(db, dict(i=1))
+    first = client.get('/query_page', headers=auth)
+    etag = first.headers['etag']
+    assert client.get('/query_page', headers={**auth, 'If-None-Match': etag}).status_code == 304
+    # 参数不同时ETag不同
+    assert client.get('/query_page', params={'limit': 1}, headers=auth).headers['etag'] != etag
+    client.post('/change_available', json={'id': ids[0], 'available': False}, headers=auth)
+    changed = client.get('/query_page', headers={**auth, 'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['etag'] != etag
+
+
+def test_no_etag_without_result_cache(client, auth, db, monkeypatch):
+    monkeypatch.setattr(settings, 'result_cache_enabled', False)
+    assert 'etag' not in client.get('/query_page', headers=auth).headers
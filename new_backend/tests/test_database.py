@@ -0,0 +1,69 @@
+"""
+数据库引擎配置: SQLite的PRAGMA、内存数据库的连接池、异步驱动地址
+"""
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+from sql_app import database
+from sql_app.config import settings
+
+
+def pragmas(engine):
+    with engine.connect() as conn:
+        return {name: conn.execute(text(f'PRAGMA {name}')).scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size')}
+
+
+def test_sqlite_pragmas(tmp_path, monkeypatch):
+    engine = database.create_db_engine(f'sqlite:///{tmp_path / "a.db"}')
+    assert pragmas(engine) == {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -64000}
+    engine.dispose()
+    monkeypatch.setattr(settings, 'sqlite_journal_mode', 'delete')
+    monkeypatch.setattr(settings, 'sqlite_synchronous', 'full')
+    engine = database.create_db_engine(f'sqlite:///{tmp_path / "b.db"}')
+    assert pragmas(engine)['journal_mode'] == 'delete'
+    assert pragmas(engine)['synchronous'] == 2
+    engine.dispose()
+
+
+def test_invalid_pragma(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'sqlite_journal_mode', 'wal; DROP TABLE DonorInfo')
+    engine = database.create_db_engine(f'sqlite:///{tmp_path / "a.db"}')
+    with pytest.raises(ValueError):
+        engine.connect()
+    engine.dispose()
+
+
+def test_memory_database_shared_between_threads():
+    engine = database.create_db_engine('sqlite://')
+    assert isinstance(engine.pool, StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (x INTEGER)'))
+    result = []
+
+    def read():
+        with engine.connect() as conn:
+            result.append(conn.execute(text('SELECT count(*) FROM t')).scalar())
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    assert result == [0]
+
+
+def test_file_database_pool_settings(tmp_path):
+    engine = database.create_db_engine(f'sqlite:///{tmp_path / "a.db"}')
+    assert engine.pool.size() == settings.pool_size
+    engine.dispose()
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('sqlite:///./test.db', 'sqlite+aiosqlite:///./test.db'),
+    ('mysql+pymysql://user:pw@db/test', 'mysql+asyncmy://user:pw@db/test'),
+    ('postgresql+asyncpg://user:pw@db/test', 'postgresql+asyncpg://user:pw@db/test'),
+])
+def test_to_async_url(url, expected):
+    assert database.to_async_url(url) == expected
@@ -0,0 +1,40 @@
+"""
+疑似重复检测: 规范化、新增时的候选查找、全表聚类
+"""
+from conftest import add_donors, donor
+
+from sql_app import crud, dedup
+
+
+def test_normalize():
+    assert dedup.normalize_id_num('110101 900101 001') == '110101199001010015'
+    assert dedup.normalize_id_num('11010119900101001x') == '11010119900101001X'
+    assert dedup.normalize_phone('+86 138-0000-0000') == '13800000000'
+    assert dedup.normalize_name(' 张 三 ') == '张三'
+
+
+def test_name_match_filters_age_before_limit(db):
+    old = add_donors(db, dict(i=0, name='王五', age='31'))
+    odd = add_donors(db, dict(i=1, name='王五', age='030'), dict(i=2, name='王五', age='未知'),
+                     dict(i=3, name='王五', age='040'))
+    # 较新的同名数据多于limit，年龄都不相近
+    add_donors(db, *(dict(i=i, name='王五', age='50') for i in range(10, 40)))
+    found = crud.find_duplicate_candidates(db, name='王 五', gender='男', age='30', limit=20)
+    assert sorted(row['id'] for row in found) == sorted(old + odd[:2])
+    assert all(row['matched'] == ['name'] for row in found)
+
+
+def test_match_by_id_num_and_phone(db):
+    row_id, = add_donors(db, dict(i=1))
+    found = crud.find_duplicate_candidates(db, name='李四', gender='女', age='60',
+                                           id_num=donor(1)['id_num'], phone='+86' + donor(1)['phone'])
+    assert [(row['id'], row['matched']) for row in found] == [(row_id, ['id_num', 'phone'])]
+    assert crud.find_duplicate_candidates(db, id_num=donor(1)['id_num'], exclude_id=row_id) == []
+
+
+def test_clusters_anchor_on_youngest_age(db):
+    ids = add_donors(db, *(dict(i=i, name='赵六', age=str(age)) for i, age in enumerate([30, 31, 32, 33])))
+    shared = add_donors(db, dict(i=20, name='孙七', phone='13900000000'), dict(i=21, name='周八', phone='13900000000'))
+    clusters = dedup.find_duplicate_clusters(db, chunk_size=2)
+    # 相邻年龄不逐个传递，30-33不会连成一组
+    assert clusters == [(ids[:2], {'name'}), (ids[2:], {'name'}), (shared, {'phone'})]
@@ -0,0 +1,42 @@
+"""
+/export流式导出
+"""
+import csv
+import io
+import json
+
+from conftest import add_donors
+
+from sql_app import export
+
+
+def test_ndjson(client, auth, db):
+    ids = add_donors(db, *(dict(i=i, date=f'2023-09-0{i + 1}') for i in range(3)))
+    response = client.get('/export', headers=auth)
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['id'] for row in rows] == ids
+    assert rows[0]['date'] == '2023-09-01' and rows[0]['name'] == '张三0'
+
+
+def test_csv_with_filters(client, auth, db):
+    ids = add_donors(db, *(dict(i=i, date=f'2023-09-0{i + 1}', place='北京' if i else '上海') for i in range(4)))
+    # 时间段包含结束日期当天
+    response = client.get('/export', params={'fmt': 'csv', 'start_time': '2023-09-02', 'end_time': '2023-09-03',
+                                              'keyword': 'place', 'con': '北'}, headers=auth)
+    assert response.text.startswith('\ufeff')
+    rows = list(csv.DictReader(io.StringIO(response.text.lstrip('\ufeff'))))
+    assert [int(row['id']) for row in rows] == ids[1:3]
+    assert list(rows[0]) == export.EXPORT_FIELDS
+
+
+def test_unknown_keyword(client, auth, db):
+    assert client.get('/export', params={'keyword': 'password', 'con': 'x'}, headers=auth).status_code == 400
+
+
+def test_chunks():
+    rows = [(i, f'张三{i}') + (None,) * (len(export.EXPORT_FIELDS) - 2) for i in range(5)]
+    chunks = list(export.iter_ndjson(rows, chunk_size=2))
+    assert [chunk.count('\n') for chunk in chunks] == [2, 2, 1]
+    # 表头单独一块，之后每块chunk_size行
+    assert [chunk.count('\n') for chunk in export.iter_csv(rows, chunk_size=2)] == [1, 2, 2, 1]
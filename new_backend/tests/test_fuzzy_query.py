@@ -0,0 +1,45 @@
+"""
+模糊查询: 全文索引与普通匹配的结果一致，触发器使索引与DonorInfo同步
+"""
+from conftest import add_donors
+from sqlalchemy import delete, update
+
+from sql_app import crud, models
+
+
+def found(db, attr_name, con):
+    return sorted(row['id'] for row in crud.fuzzy_query_donorInfo(db, attr_name, con))
+
+
+def test_fts_index_exists(db):
+    assert crud.has_fts(db.get_bind())
+
+
+def test_fts_matches_substrings(db):
+    ids = add_donors(db, dict(i=1, name='张三丰', place='北京市海淀区'), dict(i=2, name='李三丰', place='上海"浦东'),
+                     dict(i=3, name='王五', place='北京市朝阳区'))
+    assert found(db, 'name', '张三丰') == ids[:1]
+    assert found(db, None, '北京市') == [ids[0], ids[2]]
+    # 短于3个字符时使用普通匹配
+    assert found(db, 'name', '三丰') == ids[:2]
+    # 引号作为普通字符
+    assert found(db, 'place', '上海"浦') == ids[1:2]
+    # 限定列时不匹配其他列
+    assert found(db, 'name', '北京市') == []
+    assert found(db, 'phone', '0000001') == ids[:1]
+
+
+def test_fts_follows_updates_and_deletes(db):
+    ids = add_donors(db, dict(i=1, name='张三丰'), dict(i=2, name='张三丰'))
+    db.execute(update(models.DonorInfo).where(models.DonorInfo.id == ids[0]).values(name='赵六'))
+    db.execute(delete(models.DonorInfo).where(models.DonorInfo.id == ids[1]))
+    db.commit()
+    assert found(db, 'name', '张三丰') == []
+    assert found(db, None, '赵六') == ids[:1]
+
+
+def test_fuzzy_query_endpoint(client, auth, db):
+    ids = add_donors(db, dict(i=1, name='张三丰'), dict(i=2, name='王五'))
+    response = client.post('/fuzzy_query', json={'keyword': 'name', 'con': '张三丰'}, headers=auth)
+    assert [row['id'] for row in response.json()] == ids[:1]
+    assert client.post('/fuzzy_query', json={'keyword': 'password', 'con': 'abc'}, headers=auth).status_code == 400
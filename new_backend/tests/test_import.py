@@ -0,0 +1,73 @@
+"""
+批量录入: 逐行校验，有效数据一次分配流水号并批量写入
+"""
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from conftest import donor
+from sqlalchemy import func, select
+
+from sql_app import importer, models
+from sql_app.config import settings
+
+HEADER = ['姓名', '年龄', '性别', '身份证号码', '样品类型', '采样数量', '采样日期', '采样地点', '联系电话']
+
+
+def csv_file(rows, encoding='utf-8-sig'):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for row in rows:
+        writer.writerow(row)
+    return buffer.getvalue().encode(encoding)
+
+
+def row(i, **fields):
+    values = donor(i, **fields)
+    return [values[name] for name in ('name', 'age', 'gender', 'id_num', 'sample_type', 'sample_quantity', 'date',
+                                      'place', 'phone')]
+
+
+def test_add_batch_reports_each_row(client, auth, db):
+    records = [donor(1), donor(2, sample_type='未知样品'), {'name': '缺少字段'}, donor(3, sample_type='外周血')]
+    report = client.post('/add_batch', json=records, headers=auth).json()
+    assert (report['total'], report['succeeded'], report['failed']) == (4, 2, 2)
+    assert [r['row'] for r in report['results']] == [1, 2, 3, 4]
+    assert '未知样品类型' in report['results'][1]['error']
+    today = datetime.today().strftime('%Y%m%d')
+    assert report['results'][0]['serial'] == f'{today}_BM_001'
+    assert report['results'][3]['serial'].startswith(f'{today}_PB_')
+    assert db.scalar(select(func.count()).select_from(models.DonorInfo)) == 2
+
+
+def test_add_batch_row_limit(client, auth, monkeypatch):
+    monkeypatch.setattr(settings, 'import_max_rows', 2)
+    assert client.post('/add_batch', json=[donor(i) for i in range(3)], headers=auth).status_code == 400
+
+
+@pytest.mark.parametrize('encoding', ['utf-8-sig', 'gbk'])
+def test_import_csv(client, auth, db, encoding):
+    content = csv_file([row(1), [''] * len(HEADER), row(2, age='')], encoding)
+    response = client.post('/import', files={'file': ('donors.csv', content, 'text/csv')}, headers=auth)
+    report = response.json()
+    # 行号为表格中的行号，空行跳过
+    assert [(r['row'], r['ok']) for r in report['results']] == [(2, True), (4, False)]
+
+
+def test_import_rejects_unknown_file(client, auth):
+    response = client.post('/import', files={'file': ('donors.txt', b'x', 'text/plain')}, headers=auth)
+    assert response.status_code == 400
+
+
+def test_parse_xlsx():
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    workbook.active.append(HEADER)
+    workbook.active.append(row(1, age=30, sample_quantity=1.0))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    (line_no, record), = importer.parse_donor_file('donors.xlsx', buffer.getvalue())
+    assert line_no == 2
+    assert (record['name'], record['age'], record['sample_quantity']) == ('张三1', '30', '1')
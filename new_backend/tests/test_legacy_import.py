@@ -0,0 +1,84 @@
+"""
+从Flask后端数据库导入: 分批提交、中断后继续、导入后流水号计数
+"""
+import datetime
+
+import pytest
+from conftest import add_donors
+from sqlalchemy import create_engine, func, insert, select
+
+from sql_app import crud, legacy_import, models
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Flask后端表结构的源数据库，返回(引擎, 写入函数)"""
+    source_engine = create_engine(f'sqlite:///{tmp_path / "legacy.db"}')
+    legacy_import.legacy_metadata.create_all(source_engine)
+
+    def add(*serials):
+        with source_engine.begin() as conn:
+            start = conn.scalar(select(func.count()).select_from(legacy_import.legacy_donor))
+            conn.execute(insert(legacy_import.legacy_donor), [
+                dict(id=start + i + 1, name=f'李四{start + i}', age=40, gender='女', id_num=None,
+                     sample_type='骨髓', sample_quantity='1', date=datetime.datetime(2023, 9, 1), place='上海',
+                     phone=None, serial=serial, available=True, create_time=datetime.datetime(2023, 9, 1, 8),
+                     update_time=None)
+                for i, serial in enumerate(serials)])
+
+    yield source_engine, add
+    source_engine.dispose()
+
+
+def test_resume_after_interruption(db, source):
+    source_engine, add = source
+    add(*(f'20230901_BM_{i:03d}' for i in range(1, 6)))
+
+    assert legacy_import.import_legacy(source_engine, db, 'legacy', chunk_size=2, max_chunks=1) == 2
+    checkpoint = db.get(models.LegacyImport, 'legacy')
+    assert (checkpoint.last_id, checkpoint.rows) == (2, 2)
+
+    # 重新运行从上次提交的位置继续，不重复导入
+    assert legacy_import.import_legacy(source_engine, db, 'legacy', chunk_size=2) == 3
+    assert db.scalar(select(func.count()).select_from(models.DonorInfo)) == 5
+    # 源数据库新增的数据在下次运行时导入
+    add('20230901_BM_006')
+    assert legacy_import.import_legacy(source_engine, db, 'legacy', chunk_size=2) == 1
+    checkpoint = db.get(models.LegacyImport, 'legacy')
+    assert (checkpoint.last_id, checkpoint.rows, checkpoint.renamed) == (6, 6, 0)
+
+
+def test_import_raises_serial_counter(db, source):
+    source_engine, add = source
+    # 导入前已经分配过当天的号码，计数行已存在
+    assert crud.allocate_serial(db, '20230901', 'BM') == 1
+    db.commit()
+    add('20230901_BM_001', '20230901_BM_007', '20230901_BM_004', '20230901_PB_002', None)
+
+    legacy_import.import_legacy(source_engine, db, 'legacy')
+    assert crud.allocate_serial(db, '20230901', 'BM') == 8
+    # 没有计数行时从已存在的最大序号开始
+    assert crud.allocate_serial(db, '20230901', 'PB') == 3
+
+
+def test_conflicting_serials_are_renamed(db, source):
+    source_engine, add = source
+    existing_id, = add_donors(db, dict(i=1))
+    existing = db.get(models.DonorInfo, existing_id).serial
+    add(existing, existing, '20230901_BM_009')
+    legacy_import.import_legacy(source_engine, db, 'legacy')
+    serials = db.scalars(select(models.DonorInfo.serial).order_by(models.DonorInfo.id)).all()
+    # 与已有数据及同一批中重复的流水号加上源数据id
+    assert serials == [existing, f'{existing}_1', f'{existing}_2', '20230901_BM_009']
+    assert db.get(models.LegacyImport, 'legacy').renamed == 2
+
+
+def test_checksum_mismatch_rolls_back(db, source, monkeypatch):
+    source_engine, add = source
+    add('20230901_BM_001', '20230901_BM_002')
+    digests = iter(['written', 'source'])
+    monkeypatch.setattr(legacy_import, 'checksum', lambda rows: next(digests))
+    with pytest.raises(ValueError):
+        legacy_import.import_legacy(source_engine, db, 'legacy')
+    assert db.scalar(select(func.count()).select_from(models.DonorInfo)) == 0
+    assert db.get(models.LegacyImport, 'legacy').last_id == 0
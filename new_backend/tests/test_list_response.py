@@ -0,0 +1,28 @@
+"""
+列表接口直接序列化列投影的结果，输出与按response_model校验后的相同
+"""
+from conftest import add_donors
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+
+from sql_app import crud, models, schemas
+
+
+def expected(db, ids):
+    """逐行构造ORM对象再按DonorInfoOut校验得到的输出"""
+    donors = db.scalars(select(models.DonorInfo).where(models.DonorInfo.id.in_(ids)).order_by(models.DonorInfo.id))
+    return [jsonable_encoder(schemas.DonorInfoOut.model_validate(donor, from_attributes=True)) for donor in donors]
+
+
+def test_query_all_matches_response_model(client, auth, db):
+    ids = add_donors(db, *(dict(i=i) for i in range(3)))
+    assert list(schemas.DonorInfoOut.model_fields) == list(crud.DONOR_FIELDS)
+    response = client.get('/query_all', headers=auth)
+    assert response.headers['content-type'] == 'application/json'
+    assert sorted(response.json(), key=lambda row: row['id']) == expected(db, ids)
+
+
+def test_query_page_matches_response_model(client, auth, db):
+    ids = add_donors(db, *(dict(i=i) for i in range(3)))
+    items = client.get('/query_page', params={'order': 'asc'}, headers=auth).json()['items']
+    assert items == expected(db, ids)
@@ -0,0 +1,68 @@
+"""
+/login和创建用户的bcrypt计算在独立的线程池中执行
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sql_app import crud
+from sql_app.config import settings
+
+
+@pytest.fixture
+def hash_threads(monkeypatch):
+    """记录bcrypt计算所在的线程名和最大并发数"""
+    record = {'threads': set(), 'running': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def wrap(func):
+        def wrapper(*args):
+            with lock:
+                record['threads'].add(threading.current_thread().name)
+                record['running'] += 1
+                record['peak'] = max(record['peak'], record['running'])
+            try:
+                time.sleep(0.02)
+                return func(*args)
+            finally:
+                with lock:
+                    record['running'] -= 1
+        return wrapper
+
+    monkeypatch.setattr(crud, 'verify_password', wrap(crud.verify_password))
+    monkeypatch.setattr(crud, 'get_password_hash', wrap(crud.get_password_hash))
+    return record
+
+
+def test_login(client, db, hash_threads):
+    crud.create_user(db, 'root', 'password', 7)
+    hash_threads['threads'].clear()
+    assert client.post('/login', data={'username': 'root', 'password': 'wrong'}).status_code == 401
+    assert client.post('/login', data={'username': 'nobody', 'password': 'password'}).status_code == 401
+    token = client.post('/login', data={'username': 'root', 'password': 'password'}).json()['access_token']
+    response = client.get('/user/me/', headers={'Authorization': f'Bearer {token}'})
+    assert response.json()['user_name'] == 'root'
+    assert {name.split('_')[0] for name in hash_threads['threads']} == {'password'}
+
+
+def test_password_pool_is_bounded(client, auth, hash_threads):
+    hash_threads['threads'].clear()
+    requests = settings.password_hash_workers * 3
+    with ThreadPoolExecutor(requests) as pool:
+        responses = list(pool.map(lambda _: client.post('/login', data={'username': 'root', 'password': 'password'}),
+                                  range(requests)))
+    assert all(response.status_code == 200 for response in responses)
+    assert {name.split('_')[0] for name in hash_threads['threads']} == {'password'}
+    assert 1 < hash_threads['peak'] <= settings.password_hash_workers
+
+
+def test_create_user_endpoint(client, auth, hash_threads):
+    hash_threads['threads'].clear()
+    form = {'username': 'clerk', 'password': 'secret', 'authority': 2}
+    response = client.post('/user/create_user', data=form, headers=auth)
+    assert response.status_code == 200
+    assert client.post('/user/create_user', data=form, headers=auth).json() == '用户名不可重复'
+    assert {name.split('_')[0] for name in hash_threads['threads']} == {'password'}
+    assert client.post('/login', data={'username': 'clerk', 'password': 'secret'}).status_code == 200
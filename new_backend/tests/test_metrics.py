@@ -0,0 +1,51 @@
+"""
+请求和SQL指标
+"""
+from conftest import add_donors
+
+from sql_app import metrics
+from sql_app.config import settings
+
+
+def sample(text, line_prefix):
+    """指标文本中以line_prefix开头的一行的值"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram('t_seconds', '测试', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, '/a"b')
+    assert histogram.render()[2:] == [
+        't_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        't_seconds_bucket{route="/a\\"b",le="1"} 2',
+        't_seconds_bucket{route="/a\\"b",le="+Inf"} 3',
+        't_seconds_sum{route="/a\\"b"} 5.55',
+        't_seconds_count{route="/a\\"b"} 3',
+    ]
+
+
+def test_request_metrics(client, auth, db):
+    ids = add_donors(db, dict(i=1))
+    before = client.get('/metrics').text
+    key = 'method="GET",route="/query_page"'
+    client.get('/query_page', params={'limit': 1}, headers=auth)
+    # 同步的处理函数在线程池中执行，其中的SQL同样计入请求
+    client.post('/change_available', json={'id': ids[0], 'available': False}, headers=auth)
+    client.get('/no/such/path')
+    text = client.get('/metrics').text
+    count = f'http_request_duration_seconds_count{{{key},status="200"}}'
+    assert sample(text, count) == (sample(before, count) or 0) + 1
+    queries = f'db_queries_per_request_sum{{{key}}}'
+    assert sample(text, queries) > (sample(before, queries) or 0)
+    assert sample(text, 'db_queries_per_request_sum{method="POST",route="/change_available"}') > 0
+    assert sample(text, 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}') >= 1
+    assert sample(text, 'http_requests_in_flight') == 1
+
+
+def test_metrics_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, 'metrics_enabled', False)
+    assert client.get('/metrics').status_code == 404
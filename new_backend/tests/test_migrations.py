@@ -0,0 +1,124 @@
+"""
+在与最初版本结构相同(未升级过)的数据库上执行升级
+"""
+import threading
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from sql_app import migrate
+from sql_app.database import create_db_engine
+
+BASELINE_SCHEMA = '''
+CREATE TABLE "DonorInfo" (
+    id INTEGER NOT NULL PRIMARY KEY, name VARCHAR, age VARCHAR, gender VARCHAR, id_num VARCHAR,
+    sample_type VARCHAR, sample_quantity VARCHAR, date VARCHAR, place VARCHAR, phone VARCHAR, serial VARCHAR,
+    available BOOLEAN, create_time DATETIME, update_time DATETIME
+)
+'''
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """返回(引擎, 插入一行的函数)，升级前按最初的表结构写入数据"""
+    engine = create_db_engine(f'sqlite:///{tmp_path / "baseline.db"}')
+    with engine.begin() as conn:
+        conn.execute(text(BASELINE_SCHEMA))
+
+    def add(row_id, date='2023-09-01', serial=None, update_time='2023-09-02 10:00:00', **fields):
+        values = dict(id=row_id, name=f'张三{row_id}', age='30', gender='男', id_num=f'11010119900101{row_id:04d}',
+                      sample_type='骨髓', sample_quantity='1', date=date, place='北京', phone='13800000000',
+                      serial=serial or f'20230901_BM_{row_id:03d}', available=True,
+                      create_time='2023-09-01 10:00:00', update_time=update_time)
+        values.update(fields)
+        with engine.begin() as conn:
+            columns = ', '.join(values)
+            params = ', '.join(f':{name}' for name in values)
+            conn.execute(text(f'INSERT INTO DonorInfo ({columns}) VALUES ({params})'), values)
+
+    yield engine, add
+    engine.dispose()
+
+
+def test_upgrade_baseline_keeps_unparseable_dates(baseline):
+    engine, add = baseline
+    add(1, date='2023-9-1')
+    add(2, date='2023年09月02日')
+    add(3, date='去年冬天')
+    migrate.upgrade(engine)
+    with engine.connect() as conn:
+        dates = conn.execute(text('SELECT id, date FROM DonorInfo ORDER BY id')).all()
+        invalid = conn.execute(text('SELECT donor_id, value FROM InvalidDonorDate')).all()
+    assert dates == [(1, '2023-09-01'), (2, '2023-09-02'), (3, None)]
+    assert invalid == [(3, '去年冬天')]
+
+
+def test_upgrade_renames_duplicate_serials(baseline):
+    engine, add = baseline
+    add(1, serial='20230901_BM_001')
+    add(2, serial='20230901_BM_001')
+    add(3, serial='20230901_BM_001')
+    # 加后缀后的流水号已被占用时再加序号
+    add(4, serial='20230901_BM_001_2')
+    migrate.upgrade(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT id, serial, update_time FROM DonorInfo ORDER BY id')).all()
+    assert [(row_id, serial) for row_id, serial, _ in rows] == [
+        (1, '20230901_BM_001'), (2, '20230901_BM_001_2_2'), (3, '20230901_BM_001_3'), (4, '20230901_BM_001_2')]
+    # 升级不改变修改时间，否则所有数据都会出现在增量同步中
+    assert {str(update_time) for _, _, update_time in rows} == {'2023-09-02 10:00:00'}
+    with pytest.raises(IntegrityError):
+        add(5, serial='20230901_BM_001')
+
+
+def test_upgrade_creates_indexes(baseline):
+    engine, add = baseline
+    add(1)
+    migrate.upgrade(engine)
+    indexes = {index['name'] for index in inspect(engine).get_indexes('DonorInfo')}
+    assert {'ix_DonorInfo_serial', 'ix_DonorInfo_date_sample_type', 'ix_DonorInfo_update_time_id'} <= indexes
+    with engine.connect() as conn:
+        plan = conn.execute(text("EXPLAIN QUERY PLAN SELECT id FROM DonorInfo WHERE date >= '2023-09-01'")).all()
+    assert 'ix_DonorInfo_date' in str(plan)
+
+
+def test_upgrade_is_idempotent(baseline):
+    engine, add = baseline
+    add(1)
+    migrate.upgrade(engine)
+    with engine.connect() as conn:
+        version = migrate.get_version(conn)
+    migrate.upgrade(engine)
+    with engine.connect() as conn:
+        assert migrate.get_version(conn) == version == max(m[0] for m in migrate.MIGRATIONS)
+
+
+def test_concurrent_upgrade(baseline, tmp_path):
+    """多个worker同时启动，各自的引擎同时升级同一数据库"""
+    engine, add = baseline
+    for row_id in range(1, 201):
+        add(row_id)
+    engines = [create_db_engine(f'sqlite:///{tmp_path / "baseline.db"}') for _ in range(4)]
+    barrier = threading.Barrier(len(engines))
+    errors = []
+
+    def worker(worker_engine):
+        barrier.wait()
+        try:
+            migrate.upgrade(worker_engine)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(worker_engine,)) for worker_engine in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for worker_engine in engines:
+        worker_engine.dispose()
+    assert errors == []
+    with engine.connect() as conn:
+        versions = conn.execute(text('SELECT version FROM SchemaVersion ORDER BY version')).scalars().all()
+        assert conn.execute(text('SELECT count(*) FROM DonorInfo')).scalar() == 200
+    assert versions == sorted(m[0] for m in migrate.MIGRATIONS)
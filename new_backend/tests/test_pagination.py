@@ -0,0 +1,40 @@
+"""
+/query_page游标分页
+"""
+from conftest import add_donors
+
+
+def pages(client, auth, **params):
+    """依次翻页直到没有下一页，返回每页的id列表"""
+    result = []
+    cursor = None
+    while True:
+        body = client.get('/query_page', params={**params, **({'cursor': cursor} if cursor else {})},
+                          headers=auth).json()
+        result.append([item['id'] for item in body['items']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return result
+
+
+def test_pages_cover_all_rows_once(client, auth, db):
+    ids = add_donors(db, *(dict(i=i) for i in range(7)))
+    assert pages(client, auth, limit=3) == [ids[6:3:-1], ids[3:0:-1], ids[:1]]
+    assert pages(client, auth, limit=3, order='asc') == [ids[:3], ids[3:6], ids[6:]]
+    # 刚好整页时最后一页之后没有空页
+    assert pages(client, auth, limit=7) == [ids[::-1]]
+
+
+def test_rows_added_while_paging_do_not_shift_pages(client, auth, db):
+    ids = add_donors(db, *(dict(i=i) for i in range(4)))
+    first = client.get('/query_page', params={'limit': 2}, headers=auth).json()
+    add_donors(db, dict(i=10))
+    second = client.get('/query_page', params={'limit': 2, 'cursor': first['next_cursor']}, headers=auth).json()
+    assert [item['id'] for item in second['items']] == [ids[1], ids[0]]
+
+
+def test_invalid_cursor(client, auth, db):
+    add_donors(db, *(dict(i=i) for i in range(3)))
+    cursor = client.get('/query_page', params={'limit': 1}, headers=auth).json()['next_cursor']
+    assert client.get('/query_page', params={'cursor': cursor, 'order': 'asc'}, headers=auth).status_code == 400
+    assert client.get('/query_page', params={'cursor': 'not-a-cursor'}, headers=auth).status_code == 400
@@ -0,0 +1,46 @@
+import time
+
+from sqlalchemy import event, update
+
+from sql_app import crud, models
+from sql_app.cache import shared_versions
+from sql_app.database import engine
+
+
+def count_version_queries(func):
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+    return sum('DataVersion' in s for s in statements), len(statements)
+
+
+def test_cached_principal_skips_database(client, auth):
+    assert client.get('/user/me/', headers=auth).status_code == 200
+    version_queries, total = count_version_queries(lambda: client.get('/user/me/', headers=auth))
+    assert (version_queries, total) == (0, 0)
+
+
+def test_local_change_is_immediate(client, auth, db):
+    user_id = client.get('/user/me/', headers=auth).json()['id']
+    crud.change_user_authority(db, user_id, 0)
+    assert client.get('/query_all', headers=auth).json() == '权限不足'
+
+
+def test_change_from_other_worker_applies_after_check_interval(client, auth, db, monkeypatch):
+    monkeypatch.setattr(shared_versions, 'ttl', 0.05)
+    shared_versions.clear()
+    assert client.get('/query_all', headers=auth).status_code == 200
+    # 其他worker修改权限: 只修改数据库，不清空本进程的缓存
+    user = models.User
+    db.execute(update(user).where(user.user_name == 'root').values(authority=0))
+    crud.bump_data_version(db, 'user')
+    db.commit()
+    time.sleep(0.1)
+    assert client.get('/query_all', headers=auth).json() == '权限不足'
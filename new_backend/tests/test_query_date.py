@@ -0,0 +1,33 @@
+"""
+采样日期: 各种格式统一为date，时间段查询包含起止两天
+"""
+import datetime
+
+import pytest
+from conftest import add_donors, donor
+
+from sql_app import schemas
+
+
+@pytest.mark.parametrize('value', ['2023-9-1', '2023/09/01', '2023.9.01', '20230901', '2023年9月1日',
+                                   '2023-09-01 10:00:00', datetime.datetime(2023, 9, 1, 10)])
+def test_parse_date(value):
+    assert schemas.parse_date(value) == datetime.date(2023, 9, 1)
+
+
+@pytest.mark.parametrize('value', ['去年冬天', '2023', '', None])
+def test_parse_date_invalid(value):
+    with pytest.raises(ValueError):
+        schemas.parse_date(value)
+
+
+def test_query_date_range(client, auth, db):
+    ids = add_donors(db, *(dict(i=i, date=f'2023-09-0{i + 1}') for i in range(5)))
+    response = client.post('/query_datas', json={'start_time': '2023/9/2', 'end_time': '20230904'}, headers=auth)
+    assert sorted(row['id'] for row in response.json()) == ids[1:4]
+    assert response.json()[0]['date'] == '2023-09-04'
+
+
+def test_add_normalizes_date(client, auth, db):
+    response = client.post('/add', json=donor(1, date='2023年9月1日'), headers=auth)
+    assert response.json()['date'] == '2023-09-01'
@@ -0,0 +1,58 @@
+"""
+只读接口的从库路由: 轮流使用从库，用户写入后一段时间内其读请求仍走主库
+"""
+import sqlite3
+import time
+
+import pytest
+from conftest import DB_PATH, add_donors, donor
+from sqlalchemy.orm import sessionmaker
+
+import main
+from sql_app import crud
+from sql_app.database import ReplicaRouter, create_db_engine
+
+
+def test_router_round_robin_and_sticky():
+    router = ReplicaRouter('primary', ['r1', 'r2'], sticky_seconds=0.05)
+    assert [router.choose('a')[0] for _ in range(3)] == ['r1', 'r2', 'r1']
+    router.mark_write('a')
+    assert router.choose('a') == ('primary', False)
+    assert router.choose('b')[1] is True
+    time.sleep(0.06)
+    assert router.choose('a')[1] is True
+    # 没有从库时总是主库，也不记录写入
+    router = ReplicaRouter('primary', [], sticky_seconds=5)
+    router.mark_write('a')
+    assert router.choose(None) == ('primary', False)
+
+
+@pytest.fixture
+def lagging_replica(db, tmp_path, monkeypatch):
+    """主库当前数据的副本，之后的写入不会同步过去"""
+    add_donors(db, dict(i=1))
+    path = str(tmp_path / 'replica.db')
+    with sqlite3.connect(DB_PATH) as source, sqlite3.connect(path) as target:
+        source.backup(target)
+    replica_engine = create_db_engine(f'sqlite:///{path}')
+    router = ReplicaRouter(main.SessionLocal, [sessionmaker(bind=replica_engine)], sticky_seconds=0.2)
+    monkeypatch.setattr(main, 'read_router', router)
+    yield router
+    replica_engine.dispose()
+
+
+def login(client, db, name):
+    crud.create_user(db, name, 'password', 7)
+    token = client.post('/login', data={'username': name, 'password': 'password'}).json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_read_your_writes(client, db, lagging_replica):
+    writer, reader = login(client, db, 'writer'), login(client, db, 'reader')
+    client.post('/add', json=donor(2), headers=writer)
+    assert len(client.get('/query_all', headers=writer).json()) == 2
+    # 其他用户读从库，从库可能落后，结果不返回ETag
+    response = client.get('/query_all', headers=reader)
+    assert len(response.json()) == 1 and 'etag' not in response.headers
+    time.sleep(0.25)
+    assert len(client.get('/query_all', headers=writer).json()) == 1
@@ -0,0 +1,94 @@
+"""
+查询结果缓存: 键中包含数据库中的数据版本，任一进程提交修改后旧结果不再命中
+"""
+import time
+
+import pytest
+from conftest import add_donors
+from sqlalchemy import event
+
+import main
+from sql_app import crud
+from sql_app.cache import LRUCache, MemoryCacheBackend, ResultCache, SQLiteCacheBackend
+from sql_app.database import SessionLocal, engine
+
+QUERY = {'start_time': '2023-09-01', 'end_time': '2023-09-30'}
+
+
+@pytest.fixture
+def result_cache(monkeypatch):
+    cache = ResultCache(MemoryCacheBackend(maxsize=16), max_item_bytes=1 << 20)
+    monkeypatch.setattr(main, 'result_cache', cache)
+    return cache
+
+
+def donor_queries(func):
+    """执行func期间查询DonorInfo的SQL条数"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+    return result, sum('FROM "DonorInfo"' in s for s in statements)
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    time.sleep(0.06)
+    assert cache.get('a') is None
+
+
+def test_sqlite_backend_shared_between_workers(tmp_path):
+    first = SQLiteCacheBackend(str(tmp_path / 'cache.db'), maxsize=2)
+    second = SQLiteCacheBackend(str(tmp_path / 'cache.db'), maxsize=2)
+    first.set('a', b'1')
+    assert second.get('a') == b'1'
+    second.set('b', b'2')
+    time.sleep(0.01)
+    first.get('a')
+    first.set('c', b'3')
+    # 超出容量时淘汰最久未访问的
+    assert (second.get('a'), second.get('b'), second.get('c')) == (b'1', None, b'3')
+
+
+def test_cached_until_data_changes(client, auth, db, result_cache):
+    add_donors(db, dict(i=1))
+    first, queries = donor_queries(lambda: client.post('/query_datas', json=QUERY, headers=auth).json())
+    assert len(first) == 1 and queries == 1
+    second, queries = donor_queries(lambda: client.post('/query_datas', json=QUERY, headers=auth).json())
+    assert second == first and queries == 0
+    # 其他worker或命令行工具提交的修改: 数据库中的版本加一
+    with SessionLocal() as other:
+        add_donors(other, dict(i=2))
+    third, queries = donor_queries(lambda: client.post('/query_datas', json=QUERY, headers=auth).json())
+    assert len(third) == 2 and queries == 1
+
+
+def test_cache_key_includes_params(client, auth, db, result_cache):
+    add_donors(db, dict(i=1, name='张三丰'), dict(i=2, name='李四'))
+    names = [client.post('/fuzzy_query', json={'keyword': 'name', 'con': con}, headers=auth).json()[0]['name']
+             for con in ('张三丰', '李四')]
+    assert names == ['张三丰', '李四']
+
+
+def test_large_results_not_cached():
+    cache = ResultCache(MemoryCacheBackend(maxsize=16), max_item_bytes=4)
+    cache.set('a', b'12345')
+    assert cache.get('a') is None
+
+
+def test_data_version(db):
+    version, _ = crud.get_data_version(db)
+    add_donors(db, dict(i=1))
+    new_version, changed_at = crud.get_data_version(db)
+    assert new_version != version and time.time() - changed_at < 5
@@ -0,0 +1,52 @@
+"""
+/search组合条件查询
+"""
+from conftest import add_donors
+
+from sql_app import crud, schemas
+
+
+def search(client, auth, **query):
+    return client.post('/search', json=query, headers=auth)
+
+
+def test_predicates_combine(client, auth, db):
+    ids = add_donors(db, dict(i=1, date='2023-09-01', place='北京市海淀区'),
+                     dict(i=2, date='2023-09-03', place='北京市朝阳区', gender='女'),
+                     dict(i=3, date='2023-09-05', place='上海市浦东新区'),
+                     dict(i=4, date='2023-09-03', place='北京市海淀区'))
+    body = search(client, auth, predicates=[
+        {'field': 'date', 'op': 'range', 'start': '2023-09-01', 'end': '2023/9/3'},
+        {'field': 'place', 'op': 'contains', 'value': '北京市'},
+        {'field': 'gender', 'op': 'eq', 'value': '男'},
+        {'field': 'serial', 'op': 'prefix', 'value': '20230901_BM_'},
+    ]).json()
+    assert sorted(item['id'] for item in body['items']) == [ids[0], ids[3]]
+    assert (body['total'], body['total_is_estimate']) == (2, False)
+    # 只给一端的范围、短于3个字符的包含条件
+    body = search(client, auth, predicates=[{'field': 'date', 'op': 'range', 'start': '2023-09-04'},
+                                            {'field': 'place', 'op': 'contains', 'value': '浦东'}]).json()
+    assert [item['id'] for item in body['items']] == [ids[2]]
+
+
+def test_sort_and_limit(client, auth, db):
+    ids = add_donors(db, *(dict(i=i, date=f'2023-09-0{3 - i % 3}') for i in range(6)))
+    body = search(client, auth, sort=['date'], limit=4).json()
+    # 日期相同时按id降序
+    assert [item['id'] for item in body['items']] == [ids[5], ids[2], ids[4], ids[1]]
+    assert (body['total'], body['total_is_estimate']) == (6, False)
+
+
+def test_total_is_capped(db):
+    add_donors(db, *(dict(i=i) for i in range(5)))
+    items, total, is_estimate = crud.search_donorInfo(db, schemas.SearchQuery(limit=2), count_limit=3)
+    assert (len(items), total, is_estimate) == (2, 3, True)
+
+
+def test_invalid_queries(client, auth, db):
+    for predicate in ({'field': 'password_hash', 'op': 'eq', 'value': 'x'},
+                      {'field': 'date', 'op': 'range'},
+                      {'field': 'name', 'op': 'prefix', 'value': ''},
+                      {'field': 'id', 'op': 'eq', 'value': 'abc'}):
+        assert search(client, auth, predicates=[predicate]).status_code == 400
+    assert search(client, auth, sort=['-password_hash']).status_code == 400
@@ -0,0 +1,37 @@
+import datetime
+
+from sql_app import crud, models
+
+
+def test_allocate_serial_counts_per_sample_code(db):
+    assert crud.allocate_serial(db, '20230901', 'BM') == 1
+    assert crud.allocate_serial(db, '20230901', 'BM', count=3) == 4
+    assert crud.allocate_serial(db, '20230901', 'PB') == 1
+    assert crud.allocate_serial(db, '20230902', 'BM') == 1
+
+
+def test_allocate_serial_starts_after_highest_existing_suffix(db):
+    # 启用计数器之前录入的流水号可能不连续，以数量为起点会与_003重复
+    for serial in ('20230901_BM_003', '20230901_BM_001_5', '20230901_PB_009', 'bad'):
+        db.add(models.DonorInfo(serial=serial))
+    db.commit()
+    assert crud.allocate_serial(db, '20230901', 'BM') == 4
+    assert crud.allocate_serial(db, '20230901', 'CB') == 1
+
+
+def test_add_after_existing_serials_with_gaps(client, auth, db):
+    today = datetime.date.today().strftime('%Y%m%d')
+    db.add(models.DonorInfo(serial=f'{today}_BM_003'))
+    db.commit()
+    from conftest import donor
+
+    responses = [client.post('/add', json=donor(i), headers=auth) for i in range(2)]
+    assert [r.status_code for r in responses] == [200, 200]
+    assert [r.json()['serial'] for r in responses] == [f'{today}_BM_004', f'{today}_BM_005']
+
+
+def test_parse_serial():
+    assert crud.parse_serial('20230901_BM_012') == ('20230901', 'BM', 12)
+    assert crud.parse_serial('20230901_BM_012_7') == ('20230901', 'BM', 12)
+    assert crud.parse_serial('20230901_BM_x') is None
+    assert crud.parse_serial(None) is None
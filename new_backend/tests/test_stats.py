@@ -0,0 +1,44 @@
+"""
+每日统计: 增量维护的结果与重新生成的一致
+"""
+from conftest import add_donors, donor
+from sqlalchemy import select
+
+from sql_app import crud, models
+
+
+def snapshot(db):
+    stats = models.DailyStats
+    db.expire_all()
+    return sorted(db.execute(select(stats.day, stats.sample_type, stats.place, stats.available, stats.count)).all())
+
+
+def test_incremental_matches_rebuild(client, auth, db):
+    ids = add_donors(db, dict(i=1, date='2023-09-01'), dict(i=2, date='2023-09-01', place='上海'),
+                     dict(i=3, date='2023-09-02', sample_type='外周血'))
+    client.post('/add', json=donor(4, date='2023-09-02', sample_type='外周血'), headers=auth)
+    client.post('/add_batch', json=[donor(5, date='2023-09-03')], headers=auth)
+    client.post('/change_available', json={'id': ids[0], 'available': False}, headers=auth)
+    # 未修改时不重复计数
+    client.post('/change_available', json={'id': ids[0], 'available': False}, headers=auth)
+    client.post('/change_available', json={'id': ids[1], 'available': False}, headers=auth)
+    client.post('/change_available', json={'id': ids[1], 'available': True}, headers=auth)
+    incremental = snapshot(db)
+    crud.rebuild_daily_stats(db)
+    assert snapshot(db) == incremental
+    # 计数为0的行被删除
+    assert all(row.count > 0 for row in incremental)
+
+
+def test_stats_endpoint(client, auth, db):
+    add_donors(db, dict(i=1, date='2023-09-01'), dict(i=2, date='2023-09-01', place='上海'),
+               dict(i=3, date='2023-09-02', sample_type='外周血'), dict(i=4, date='2023-09-05'))
+    params = {'start_time': '2023-09-01', 'end_time': '2023-09-02'}
+    assert client.get('/stats', params=params, headers=auth).json() == [
+        {'day': '2023-09-01', 'count': 2}, {'day': '2023-09-02', 'count': 1}]
+    response = client.get('/stats', params={**params, 'group_by': ['place', 'sample_type']}, headers=auth)
+    # 分组字段按固定顺序
+    assert response.json() == [{'sample_type': '外周血', 'place': '北京', 'count': 1},
+                               {'sample_type': '骨髓', 'place': '上海', 'count': 1},
+                               {'sample_type': '骨髓', 'place': '北京', 'count': 1}]
+    assert client.get('/stats', params={**params, 'group_by': 'password'}, headers=auth).status_code == 422
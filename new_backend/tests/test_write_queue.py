@@ -0,0 +1,54 @@
+"""
+合并写入队列: 多个请求合并为一个事务，出错的数据不影响同一批中的其他请求
+"""
+from datetime import datetime
+
+import pytest
+from conftest import donor
+
+from sql_app import crud, schemas
+from sql_app.database import SessionLocal
+from sql_app.write_queue import WriteQueue
+
+
+@pytest.fixture
+def bulk_calls(monkeypatch):
+    """记录每次add_donorInfo_bulk写入的条数"""
+    calls = []
+    add_donorInfo_bulk = crud.add_donorInfo_bulk
+
+    def wrapper(db, infos, day):
+        calls.append(len(infos))
+        return add_donorInfo_bulk(db, infos, day)
+
+    monkeypatch.setattr(crud, 'add_donorInfo_bulk', wrapper)
+    return calls
+
+
+def submit_all(infos):
+    """在一批之内提交全部数据，返回各请求的Future"""
+    write_queue = WriteQueue(SessionLocal, max_batch=len(infos), max_wait=5)
+    futures = [write_queue.submit(info, 'BM') for info in infos]
+    for future in futures:
+        future.exception(timeout=10)
+    write_queue.stop()
+    return futures
+
+
+def test_batch_in_one_transaction(db, bulk_calls):
+    futures = submit_all([schemas.DonorInfoBase(**donor(i)) for i in range(5)])
+    today = datetime.today().strftime('%Y%m%d')
+    assert bulk_calls == [5]
+    assert [f.result()['serial'] for f in futures] == [f'{today}_BM_{i:03d}' for i in range(1, 6)]
+    assert [f.result()['name'] for f in futures] == [f'张三{i}' for i in range(5)]
+
+
+def test_bad_row_fails_alone(db, bulk_calls):
+    infos = [schemas.DonorInfoBase(**donor(i)) for i in range(3)]
+    # 未经校验的数据，写入时出错
+    infos[1] = schemas.DonorInfoBase.model_construct(**{**donor(1), 'date': '不是日期'})
+    futures = submit_all(infos)
+    today = datetime.today().strftime('%Y%m%d')
+    assert bulk_calls == [3, 1, 1, 1]
+    assert futures[1].exception() is not None
+    assert [futures[i].result()['serial'] for i in (0, 2)] == [f'{today}_BM_001', f'{today}_BM_002']